@@ -1,5 +1,6 @@
 import streamlit as st
 import json
+import logging
 import os
 import time
 from lib.state_managment import complete_running_step
@@ -7,6 +8,9 @@ from lib.directory_manager import dir_manager
 from lib.progress_tracker import ProgressTracker, BatchProgressTracker
 from datetime import datetime, timedelta
 
+# Hot-path diagnostics are logged at DEBUG; set CANIS_LOG_LEVEL=DEBUG to see them
+logging.basicConfig(level=os.getenv("CANIS_LOG_LEVEL", "WARNING").upper())
+
 
 st.set_page_config(
     page_title="Workflow Dashboard", 
@@ -3,6 +3,7 @@ import json
 import os
 from typing import Dict, Any
 import streamlit as st
+from lib.directory_manager import read_json
 
 
 class ThemeManager:
@@ -570,8 +571,8 @@ class step(object):
                             'error': 'File not found'
                         }
             
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            # Data files are written as UTF-8, so don't decode them with the platform encoding
+            data = read_json(file_path)
             
             if isinstance(data, dict):
                 sample_items = list(data.items())[:sample_size]
@@ -1,8 +1,49 @@
 import os
 import json
+import time
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(raw):
+    """Parse JSON bytes/str, using orjson when available"""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity and >64-bit ints that stdlib json accepts
+            pass
+    return json.loads(raw)
+
+def json_dumps(data, indent=False):
+    """Serialize data to UTF-8 JSON bytes, using orjson when available"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(data, option=option)
+        except TypeError:
+            # Types orjson cannot serialize (e.g. >64-bit ints) go through stdlib json
+            pass
+    return json.dumps(data, indent=2 if indent else None).encode('utf-8')
+
+def iso_timestamp(timestamp):
+    """Local-time ISO-8601 string for a POSIX timestamp, as datetime.isoformat() renders it,
+    without building a datetime object"""
+    seconds = int(timestamp)
+    micros = round((timestamp - seconds) * 1_000_000)
+    if micros == 1_000_000:
+        seconds, micros = seconds + 1, 0
+    formatted = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(seconds))
+    return f"{formatted}.{micros:06d}" if micros else formatted
+
+def read_json(file_path):
+    """Load a JSON file with one binary read, skipping the text-mode decode"""
+    return json_loads(Path(file_path).read_bytes())
+
 def normalize_path(path_input):
     """Ensure all paths are Path objects"""
     if isinstance(path_input, str):
@@ -44,6 +85,12 @@ def safe_path_join(*path_parts):
     
     return normalize_path(result)
 
+STATE_FILE_NAME = "state.json"
+STATE_JOURNAL_NAME = "state.journal.jsonl"
+STATE_JOURNAL_COMPACT_BYTES = 1024 * 1024  # fold the journal into state.json past this size
+# Bumped on every full state.json write; journal events only apply to the generation they were written against
+STATE_GENERATION_KEY = "journal_generation"
+
 class DirectoryManager:
     """Centralized directory management for the entire application"""
     
@@ -68,8 +115,7 @@ class DirectoryManager:
     
     def ensure_workflow_directory(self, workflow_name):
         """Ensure a specific workflow directory exists with proper structure"""
-        workflow_dir = self.base_dir / "runs" / workflow_name
-        workflow_dir.mkdir(parents=True, exist_ok=True)
+        workflow_dir = self.get_workflow_path(workflow_name)
         
         # Ensure CORRECT subdirectories exist for your workflow
         subdirs = [
@@ -78,9 +124,10 @@ class DirectoryManager:
             "datasets"   # for finalized Huggingface datasets
         ]
         
+        # parents=True creates the workflow directory with the first subdir, so it needs no mkdir of its own
         for subdir in subdirs:
-            (workflow_dir / subdir).mkdir(exist_ok=True)
-            print(f"✅ Created workflow subdir: {workflow_dir / subdir}")
+            (workflow_dir / subdir).mkdir(parents=True, exist_ok=True)
+        print(f"✅ Created workflow subdirs in {workflow_dir}: {', '.join(subdirs)}")
         
         return workflow_dir
     
@@ -92,6 +139,10 @@ class DirectoryManager:
         """Get the full path to a workflow's state file"""
         return self.get_workflow_path(workflow_name) / "state.json"
     
+    def get_state_journal_path(self, workflow_name):
+        """Get the full path to a workflow's append-only state journal"""
+        return self.get_workflow_path(workflow_name) / STATE_JOURNAL_NAME
+    
     def get_batch_dir(self, workflow_name):
         """Get the batch directory for a workflow"""
         batch_dir = self.get_workflow_path(workflow_name) / "batch"
@@ -133,17 +184,18 @@ class DirectoryManager:
             return []
         
         versions = []
-        for item in datasets_dir.iterdir():
-            if item.is_dir():
-                versions.append({
-                    'name': item.name,
-                    'path': str(item),
-                    'created': datetime.fromtimestamp(item.stat().st_ctime).isoformat()
-                })
-        
-        # Sort by creation time (newest first)
-        versions.sort(key=lambda x: x['created'], reverse=True)
-        return versions
+        with os.scandir(datasets_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    versions.append((entry.stat().st_ctime, entry))
+        
+        # Sort by creation time (newest first) on the raw timestamps
+        versions.sort(key=lambda version: version[0], reverse=True)
+        return [{
+            'name': entry.name,
+            'path': entry.path,
+            'created': iso_timestamp(ctime)
+        } for ctime, entry in versions]
     
     def get_batch_file_path(self, workflow_name, step_name):
         """Get the path for a batch JSONL file"""
@@ -174,9 +226,9 @@ class DirectoryManager:
             raise FileNotFoundError(f"Batch file not found: {batch_file_path}")
         
         batch_data = []
-        with open(batch_file_path, 'r') as f:
+        with open(batch_file_path, 'rb') as f:
             for line in f:
-                batch_data.append(json.loads(line.strip()))
+                batch_data.append(json_loads(line.strip()))
         
         return batch_data
     
@@ -277,8 +329,7 @@ class DirectoryManager:
         
         for file_path in seed_dir.glob("*.json"):
             try:
-                with open(file_path, 'r') as f:
-                    seed_data = json.load(f)
+                seed_data = read_json(file_path)
                 
                 # Validate seed file structure
                 if isinstance(seed_data, dict):
@@ -359,26 +410,112 @@ class DirectoryManager:
         # Single data doesn't start with 'runs/' and doesn't end with file extensions
         return not (file_path.startswith('runs/') or file_path.endswith(('.json', '.jsonl', '.txt', '.csv')))
     
-    def save_json(self, file_path, data):
-        """Safely save JSON data to a file with atomic operations and path normalization"""
+    def save_json(self, file_path, data, indent=True):
+        """Safely save JSON data to a file with atomic operations and path normalization
+        
+        Pass indent=False for machine-only files (e.g. snapshots) to write compact JSON.
+        """
+        file_path = normalize_path(file_path)
+        is_state_file = file_path.name == STATE_FILE_NAME and isinstance(data, dict)
+        if is_state_file:
+            # Orphans any journal left behind, even if we crash before unlinking it below
+            data[STATE_GENERATION_KEY] = data.get(STATE_GENERATION_KEY, 0) + 1
+        self.write_bytes_atomic(file_path, self.encode_json(data, indent=indent))
+        print(f"✅ Atomically saved JSON with normalized paths: {file_path}")
+        
+        # A full state write already contains every journaled event
+        if is_state_file:
+            journal_path = file_path.with_name(STATE_JOURNAL_NAME)
+            if journal_path.exists():
+                journal_path.unlink()
+    
+    def encode_json(self, data, indent=True):
+        """Serialize data to JSON bytes with paths normalized, as save_json writes it"""
+        return json_dumps(self._normalize_paths_in_data(data), indent=indent)
+    
+    def write_bytes_atomic(self, file_path, payload, fsync=True):
+        """Write bytes via a temporary file and os.replace
+        
+        Pass fsync=False for files that can be lost on a crash (e.g. snapshots), so they
+        do not add a durable write next to the state.json one.
+        """
         file_path = normalize_path(file_path)
         file_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Normalize paths in the data before saving
-        normalized_data = self._normalize_paths_in_data(data)
-        
-        # Use atomic write with temporary file
-        temp_path = file_path.with_suffix('.tmp')
+        # Unique temp name so concurrent writers never share (and clobber) a temp file
+        temp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{os.urandom(4).hex()}.tmp")
         try:
-            with open(temp_path, 'w') as f:
-                json.dump(normalized_data, f, indent=2)
-            temp_path.replace(file_path)
-            print(f"✅ Atomically saved JSON with normalized paths: {file_path}")
+            with open(temp_path, 'wb') as f:
+                f.write(payload)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_path, file_path)
         except Exception as e:
             if temp_path.exists():
                 temp_path.unlink()
             raise e
     
+    def append_state_events(self, workflow_name, events, generation):
+        """Append state mutations to the workflow journal instead of rewriting state.json
+        
+        generation is the STATE_GENERATION_KEY of the state the events were applied to.
+        
+        Supported events:
+            {"op": "add_node", "node": {...}}
+            {"op": "add_step", "step": {...}}
+            {"op": "set", "key": "...", "value": ...}
+        """
+        journal_path = self.get_state_journal_path(workflow_name)
+        payload = b"".join(json_dumps({**self._normalize_paths_in_data(event), "gen": generation}) + b"\n"
+                           for event in events)
+        
+        fd = os.open(journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, payload)
+            journal_size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        
+        # Keep replay cheap: once the journal grows large, rewrite state.json and drop it
+        if journal_size > STATE_JOURNAL_COMPACT_BYTES:
+            state_file_path = self.get_state_file_path(workflow_name)
+            self.save_json(state_file_path, self.load_json(state_file_path))
+    
+    def _replay_state_journal(self, state_file_path, state):
+        """Apply journaled events on top of the last full state write"""
+        journal_path = state_file_path.with_name(STATE_JOURNAL_NAME)
+        if not journal_path.exists():
+            return state
+        
+        generation = state.get(STATE_GENERATION_KEY, 0)
+        
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json_loads(line)
+                except json.JSONDecodeError:
+                    # A torn trailing line from an interrupted append
+                    print(f"⚠️  Skipping unreadable journal entry in {journal_path}")
+                    continue
+                
+                # Events from an older generation are already part of state.json
+                if event.get("gen", 0) != generation:
+                    continue
+                
+                op = event.get("op")
+                if op == "add_node":
+                    state.setdefault("nodes", []).append(event["node"])
+                elif op == "add_step":
+                    state.setdefault("state_steps", []).append(event["step"])
+                elif op == "set":
+                    state[event["key"]] = event["value"]
+        
+        return state
+    
     def atomic_save_json(self, file_path, data):
         """Atomically save JSON data with path normalization"""
         return self.save_json(file_path, data)  # Now includes path normalization
@@ -404,11 +541,15 @@ class DirectoryManager:
         if file_size > max_file_size:
             raise ValueError(f"File too large: {file_size} bytes (max: {max_file_size})")
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSON in file {file_path}: {e}")
+        try:
+            data = json_loads(file_path.read_bytes())
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in file {file_path}: {e}")
+        
+        if file_path.name == STATE_FILE_NAME:
+            data = self._replay_state_journal(file_path, data)
+        
+        return data
     
     def sanitize_filename(self, filename):
         """Sanitize filename to prevent directory traversal attacks"""
@@ -1,21 +1,164 @@
 import os
-import datetime
-import json
+import hashlib
+import logging
+import shutil
+import sys
+import tarfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from datasets import Dataset
-from .tools.batch import cancel_batch_job, upload_batch, check_batch_job, download_batch_results, convert_batch_in_to_json_data, convert_batch_out_to_json_data
+from .tools.batch import cancel_batch_job, upload_batch, check_batch_job, download_and_convert_batch_results, convert_batch_in_to_json_data
 from .tools.seed import generate_seed_batch_file
 from .tools.llm import generate_llm_tool_batch_file, prepare_data
 from .tools.code import execute_code_tool, save_code_tool_results, prepare_tool_use
 from .tools.global_func import check_data_type, is_single_data
 from .tools.chip import prepare_chip_use, start_chip_tool, finish_chip_tool, save_chip_results
-from lib.directory_manager import dir_manager
+from lib.directory_manager import dir_manager, iso_timestamp, json_loads, read_json, STATE_JOURNAL_NAME, STATE_GENERATION_KEY
 from pathlib import Path
 import streamlit as st
 
-
-
+try:
+    import fcntl
+except ImportError:
+    # Windows: state locks fall back to msvcrt byte-range locks
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Background worker for batch uploads so the network round-trip overlaps local bookkeeping
+_executor = ThreadPoolExecutor(max_workers=2)
+# Single worker so snapshot writes land in submission order
+_snapshot_executor = ThreadPoolExecutor(max_workers=1)
+# Concurrent reads of independent marker files
+_io_executor = ThreadPoolExecutor(max_workers=8)
+
+# Number of snapshots kept per workflow; older ones are pruned after each write
+SNAPSHOT_KEEP = max(int(os.getenv("CANIS_SNAPSHOT_RETAIN", "20")), 1)
+# Nodes and steps only grow between tool runs, so snapshots store them as a delta against a full one
+SNAPSHOT_HISTORY_KEYS = ("nodes", "state_steps")
+SNAPSHOT_KEYFRAME_EVERY = 10
+# workflow name -> last full snapshot written by this process
+_snapshot_keyframes = {}
+# workflow name -> (digest of the state, path) of the last snapshot written by this process
+_last_snapshot = {}
+
+
+# Workflow directories are never removed by the app, so their paths (and the mkdir that
+# get_batch_dir/get_data_dir perform) only need resolving once per workflow
+@lru_cache(maxsize=256)
+def _workflow_path(workflow_name):
+    return dir_manager.get_workflow_path(workflow_name)
+
+@lru_cache(maxsize=256)
+def _batch_dir(workflow_name):
+    return dir_manager.get_batch_dir(workflow_name)
+
+@lru_cache(maxsize=256)
+def _data_dir(workflow_name):
+    return dir_manager.get_data_dir(workflow_name)
+
+@lru_cache(maxsize=256)
+def _snapshots_dir(workflow_name):
+    snapshots_dir = _workflow_path(workflow_name) / "snapshots"
+    snapshots_dir.mkdir(exist_ok=True)
+    return snapshots_dir
+
+def reset_path_cache():
+    """Forget memoized workflow directory paths (e.g. after a workflow was deleted on disk)"""
+    _workflow_path.cache_clear()
+    _batch_dir.cache_clear()
+    _data_dir.cache_clear()
+    _snapshots_dir.cache_clear()
+
+
+# State file locking
+_held_state_locks = threading.local()
+STATE_LOCK_NAME = "state.lock"
+# lock path -> threading.Lock, so threads of this process exclude each other on every platform
+_process_state_locks = {}
+_process_state_locks_guard = threading.Lock()
+
+def _lock_file(fd):
+    """Block until this process holds the OS lock on an open lock file"""
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    elif msvcrt:
+        while True:
+            try:
+                # LK_LOCK gives up after ~10 seconds; keep waiting like flock does
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+def _unlock_file(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def _state_lock(state_file):
+    """Hold an exclusive lock on a workflow state for a load -> mutate -> save sequence.
+    
+    The lock lives on a sidecar file because save_json replaces state.json atomically.
+    Re-entrant within a thread so locked mutators can call each other.
+    """
+    lock_path = Path(state_file).resolve().with_name(STATE_LOCK_NAME)
+    held = getattr(_held_state_locks, "paths", None)
+    if held is None:
+        held = _held_state_locks.paths = set()
+    if lock_path in held:
+        yield
+        return
+    
+    with _process_state_locks_guard:
+        process_lock = _process_state_locks.setdefault(lock_path, threading.Lock())
+    
+    with process_lock:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock_file(fd)
+            held.add(lock_path)
+            try:
+                yield
+            finally:
+                held.discard(lock_path)
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+
+def _locks_state(func):
+    """Run a state mutator (first argument: state_file) under the state lock"""
+    @wraps(func)
+    def wrapper(state_file, *args, **kwargs):
+        with _state_lock(state_file):
+            return func(state_file, *args, **kwargs)
+    return wrapper
 
 # Session State Management Functions
+@_locks_state
+def update_workflow_state(state_file, update_fn):
+    """Load a workflow state, apply update_fn to it in place and save it, all under the state lock.
+    
+    Use this for any load -> mutate -> save outside this module, so no write can drop a
+    step journaled by another mutator in between. update_fn returning False skips the save.
+    """
+    state = dir_manager.load_json(state_file)
+    if update_fn(state) is False:
+        return False
+    dir_manager.save_json(state_file, state)
+    return True
+
 def cleanup_session_state(workflow_name=None):
     """Clean up session state when switching workflows"""
     try:
@@ -72,21 +215,48 @@ def set_session_state_value(workflow_name, key, value):
     except ImportError:
         pass
 
+@_locks_state
 def auto_check_running_batches(state_file):
     """Automatically check and update running batch statuses"""
-    state = dir_manager.load_json(state_file)
-    updated = False
+    state = load_state_indexed(state_file).state
     
-    for step in state['state_steps']:
-        if step.get('status') in ['uploaded', 'in_progress']:
-            try:
-                result = complete_running_step(state_file)
-                updated = True
-                print(f"✅ Auto-updated batch status: {result}")
-            except Exception as e:
-                print(f"❌ Batch check failed: {e}")
+    # complete_running_step always works on the latest step, so one call covers every pending step
+    if not any(step.get('status') in ('uploaded', 'in_progress') for step in state['state_steps']):
+        return False
     
-    return updated
+    try:
+        result = complete_running_step(state_file)
+        print(f"✅ Auto-updated batch status: {result}")
+        return True
+    except Exception as e:
+        print(f"❌ Batch check failed: {e}")
+        return False
+
+def _approx_size(obj, limit):
+    """Rough JSON-encoded size of obj in bytes, walking it only until limit is exceeded.
+    
+    Nothing is serialized, so a huge object costs no more than its first `limit` bytes' worth.
+    """
+    size = 0
+    pending = [obj]
+    while pending and size <= limit:
+        item = pending.pop()
+        if isinstance(item, str):
+            size += len(item) + 2
+        elif isinstance(item, dict):
+            size += 2 + len(item)
+            for key, value in item.items():
+                pending.append(value)
+                size += len(key) + 3 if isinstance(key, str) else 8
+        elif isinstance(item, (list, tuple, set)):
+            size += 2 + len(item)
+            pending.extend(item)
+        elif isinstance(item, (bytes, bytearray)):
+            size += len(item)
+        else:
+            # Numbers, booleans, None and opaque objects
+            size += 8
+    return size
 
 def cleanup_large_session_objects():
     """Clean up large objects from session state"""
@@ -106,56 +276,251 @@ def cleanup_large_session_objects():
         for key in keys_to_check:
             if 'flow_state' in key and isinstance(st.session_state[key], dict):
                 flow_state = st.session_state[key]
-                if len(str(flow_state)) > 100000:  # ~100KB
+                if _approx_size(flow_state, limit=100_000) > 100_000:  # ~100KB
                     del st.session_state[key]
                     print(f"✅ Removed large flow state: {key}")
     
     except ImportError:
         pass
 
+_snapshot_ns_lock = threading.Lock()
+_last_snapshot_ns = 0
+
+def _next_snapshot_ns():
+    """time.time_ns(), bumped when needed so successive calls never repeat (coarse clocks, e.g. Windows)"""
+    global _last_snapshot_ns
+    with _snapshot_ns_lock:
+        _last_snapshot_ns = max(time.time_ns(), _last_snapshot_ns + 1)
+        return _last_snapshot_ns
+
+def _new_snapshot_path(workflow_name, suffix=""):
+    """Path for a new timestamped snapshot of a workflow"""
+    snapshots_dir = _snapshots_dir(workflow_name)
+    
+    # The nanosecond prefix keeps names unique and sortable; the wall-clock suffix is for humans
+    timestamp = f"{_next_snapshot_ns():020d}_{time.strftime('%Y%m%d_%H%M%S')}"
+    return snapshots_dir / f"snapshot_{timestamp}{suffix}.json"
+
+def _encode_snapshot(state):
+    """Serialize state for a new snapshot, returning (snapshot_path, payload).
+    
+    When the workflow's last full snapshot is still a prefix of the nodes and steps,
+    only the new entries are written, with a reference to that full snapshot.
+    If the state is unchanged since the previous snapshot, that snapshot's path is
+    returned with a payload of None and nothing needs writing.
+    """
+    full_payload = dir_manager.encode_json(state, indent=False)
+    digest = hashlib.blake2b(full_payload, digest_size=16).digest()
+    last_digest, last_path = _last_snapshot.get(state["name"], (None, None))
+    if digest == last_digest:
+        return last_path, None
+    
+    snapshot_path, payload = _encode_snapshot_payload(state, full_payload)
+    _last_snapshot[state["name"]] = (digest, snapshot_path)
+    return snapshot_path, payload
+
+def _encode_snapshot_payload(state, full_payload):
+    keyframe = _snapshot_keyframes.get(state["name"])
+    if (keyframe is not None
+            and keyframe["deltas"] < SNAPSHOT_KEYFRAME_EVERY
+            and all(state.get(key, [])[:len(keyframe[key])] == keyframe[key] for key in SNAPSHOT_HISTORY_KEYS)):
+        snapshot_path = _new_snapshot_path(state["name"], suffix="_delta")
+        delta = {key: value for key, value in state.items() if key not in SNAPSHOT_HISTORY_KEYS}
+        delta["snapshot_base"] = keyframe["file_name"]
+        for key in SNAPSHOT_HISTORY_KEYS:
+            delta[key] = state.get(key, [])[len(keyframe[key]):]
+        keyframe["deltas"] += 1
+        # Snapshots are only read back by rollback, so skip pretty-printing
+        return snapshot_path, dir_manager.encode_json(delta, indent=False)
+    
+    snapshot_path = _new_snapshot_path(state["name"])
+    payload = full_payload
+    # Keep a private copy to compare later states against
+    saved = json_loads(payload)
+    _snapshot_keyframes[state["name"]] = {
+        "file_name": snapshot_path.name,
+        "deltas": 0,
+        **{key: saved.get(key, []) for key in SNAPSHOT_HISTORY_KEYS},
+    }
+    return snapshot_path, payload
+
+def _load_snapshot(snapshot_path):
+    """Load a snapshot as a full state, resolving delta snapshots against their base"""
+    snapshot = dir_manager.load_json(snapshot_path)
+    base_name = snapshot.pop("snapshot_base", None)
+    if base_name is None:
+        return snapshot
+    
+    base_path = Path(snapshot_path).parent / base_name
+    if not base_path.exists():
+        raise FileNotFoundError(f"Base snapshot not found: {base_path}")
+    base = dir_manager.load_json(base_path)
+    for key in SNAPSHOT_HISTORY_KEYS:
+        snapshot[key] = base.get(key, []) + snapshot.get(key, [])
+    return snapshot
+
+def _link_state_snapshot(workflow_name):
+    """Snapshot a workflow by hardlinking its state.json, returning the path or None if not possible.
+    
+    state.json is only ever replaced via os.replace, so the linked inode never changes afterwards.
+    It is only complete while there is no journal to replay on top of it.
+    """
+    if dir_manager.get_state_journal_path(workflow_name).exists():
+        return None
+    
+    state_file_path = dir_manager.get_state_file_path(workflow_name)
+    try:
+        state_stat = os.stat(state_file_path)
+    except OSError:
+        return None
+    
+    # Unchanged since the newest snapshot (e.g. a retried tool call): linking again would only
+    # push real history out of retention
+    snapshots = _list_snapshots(_snapshots_dir(workflow_name))
+    if snapshots:
+        try:
+            newest_stat = os.stat(snapshots[-1])
+        except OSError:
+            newest_stat = None
+        if newest_stat and (newest_stat.st_dev, newest_stat.st_ino) == (state_stat.st_dev, state_stat.st_ino):
+            return snapshots[-1]
+    
+    snapshot_path = _new_snapshot_path(workflow_name)
+    try:
+        os.link(state_file_path, snapshot_path)
+    except OSError:
+        return None
+    
+    # Later deltas must not use an older full snapshot as base once this one sits between them,
+    # and an unchanged state must not dedupe to a snapshot older than this one
+    _snapshot_keyframes.pop(workflow_name, None)
+    _last_snapshot.pop(workflow_name, None)
+    _retire_old_snapshots(snapshot_path)
+    return snapshot_path
+
 def create_workflow_snapshot(state_file):
     """Create a snapshot of workflow state before execution"""
-    state = dir_manager.load_json(state_file)
-    workflow_name = state["name"]
+    snapshot_path = _link_state_snapshot(Path(state_file).parent.name)
+    if snapshot_path is not None:
+        print(f"✅ Created workflow snapshot: {snapshot_path}")
+        return snapshot_path
     
-    # Create snapshot directory
-    workflow_path = dir_manager.get_workflow_path(workflow_name)
-    snapshots_dir = workflow_path / "snapshots"
-    snapshots_dir.mkdir(exist_ok=True)
-    
-    # Create snapshot with timestamp
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    snapshot_path = snapshots_dir / f"snapshot_{timestamp}.json"
+    state = dir_manager.load_json(state_file)
+    snapshot_path, payload = _encode_snapshot(state)
+    if payload is None:
+        # Nothing changed since the last snapshot
+        return snapshot_path
     
-    dir_manager.save_json(snapshot_path, state)
+    try:
+        dir_manager.write_bytes_atomic(snapshot_path, payload, fsync=False)
+    except Exception:
+        _forget_unwritten_snapshot(snapshot_path)
+        raise
+    _retire_old_snapshots(snapshot_path)
     print(f"✅ Created workflow snapshot: {snapshot_path}")
     
     return snapshot_path
 
+def _snapshot_sort_key(path):
+    # Legacy second-precision names (snapshot_YYYYmmdd_...) predate every time_ns-prefixed one
+    return (len(path.name.split("_")[1]) == 20, path.name)
+
+def _list_snapshots(snapshots_dir):
+    """Snapshot files of a directory, oldest first, ordered by name alone (no stat calls)"""
+    with os.scandir(snapshots_dir) as entries:
+        snapshots = [Path(entry.path) for entry in entries
+                     if entry.name.startswith("snapshot_") and entry.name.endswith(".json")]
+    return sorted(snapshots, key=_snapshot_sort_key)
+
+def _retire_old_snapshots(snapshot_path):
+    """Drop all but the newest SNAPSHOT_KEEP snapshots next to snapshot_path"""
+    snapshots = _list_snapshots(snapshot_path.parent)
+    cutoff = max(len(snapshots) - SNAPSHOT_KEEP, 0)
+    # A delta needs the full snapshot before it, so never prune past that one
+    while cutoff > 0 and snapshots[cutoff].name.endswith("_delta.json"):
+        cutoff -= 1
+    for old_snapshot in snapshots[:cutoff]:
+        old_snapshot.unlink(missing_ok=True)
+
+def _forget_unwritten_snapshot(snapshot_path):
+    """Drop in-memory references to a snapshot whose write failed"""
+    workflow_name = snapshot_path.parent.parent.name  # snapshots/<file> under the workflow dir
+    # Let the next call write the state again, and never base a delta on the missing file
+    _last_snapshot.pop(workflow_name, None)
+    _snapshot_keyframes.pop(workflow_name, None)
+
+def _write_snapshot(snapshot_path, payload):
+    try:
+        # Snapshots are recovery copies; only the state.json write needs to be durable
+        dir_manager.write_bytes_atomic(snapshot_path, payload, fsync=False)
+        _retire_old_snapshots(snapshot_path)
+        logger.debug("✅ Created workflow snapshot: %s", snapshot_path)
+    except Exception as e:
+        _forget_unwritten_snapshot(snapshot_path)
+        print(f"⚠️  Failed to write snapshot {snapshot_path}: {e}")
+
+def create_workflow_snapshot_async(state):
+    """Snapshot an already-loaded state, writing the file in the background.
+    
+    The state is serialized before returning, so callers may mutate it right away.
+    """
+    # Callers pass state freshly loaded from disk, so a hardlink of state.json captures it
+    snapshot_path = _link_state_snapshot(state["name"])
+    if snapshot_path is not None:
+        return snapshot_path
+    
+    snapshot_path, payload = _encode_snapshot(state)
+    if payload is not None:
+        _snapshot_executor.submit(_write_snapshot, snapshot_path, payload)
+    return snapshot_path
+
+def _wait_for_snapshots():
+    """Block until every queued snapshot write has finished"""
+    # The snapshot worker is single-threaded, so a no-op job runs after all earlier writes
+    _snapshot_executor.submit(lambda: None).result()
+
 def rollback_workflow_state(workflow_name, snapshot_name=None):
     """Rollback workflow to a previous snapshot"""
-    workflow_path = dir_manager.get_workflow_path(workflow_name)
-    snapshots_dir = workflow_path / "snapshots"
+    snapshots_dir = _workflow_path(workflow_name) / "snapshots"
+    _wait_for_snapshots()
     
     if not snapshots_dir.exists():
         raise FileNotFoundError("No snapshots available for rollback")
     
     if snapshot_name:
         snapshot_path = snapshots_dir / f"{snapshot_name}.json"
+        if not snapshot_path.exists():
+            raise FileNotFoundError(f"Snapshot not found: {snapshot_path}")
+        snapshot_state = _load_snapshot(snapshot_path)
     else:
-        # Get most recent snapshot
-        snapshots = list(snapshots_dir.glob("snapshot_*.json"))
+        # time_ns-prefixed names sort by creation time
+        snapshots = _list_snapshots(snapshots_dir)
         if not snapshots:
             raise FileNotFoundError("No snapshots found")
-        snapshot_path = max(snapshots, key=lambda x: x.stat().st_mtime)
-    
-    if not snapshot_path.exists():
-        raise FileNotFoundError(f"Snapshot not found: {snapshot_path}")
+        
+        # Snapshots are written without fsync, so one cut short by a crash falls back to the previous one
+        snapshot_state = None
+        for snapshot_path in reversed(snapshots):
+            try:
+                snapshot_state = _load_snapshot(snapshot_path)
+                break
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Skipping unreadable snapshot {snapshot_path}: {e}")
+        if snapshot_state is None:
+            raise FileNotFoundError("No readable snapshots found")
     
     # Restore state
-    snapshot_state = dir_manager.load_json(snapshot_path)
     state_file_path = dir_manager.get_state_file_path(workflow_name)
-    dir_manager.save_json(state_file_path, snapshot_state)
+    with _state_lock(state_file_path):
+        # Continue from the current generation so a leftover journal can never match the restored state
+        try:
+            current_generation = dir_manager.load_json(state_file_path).get(STATE_GENERATION_KEY, 0)
+        except (OSError, ValueError):
+            current_generation = 0
+        snapshot_state[STATE_GENERATION_KEY] = max(snapshot_state.get(STATE_GENERATION_KEY, 0), current_generation)
+        dir_manager.save_json(state_file_path, snapshot_state)
+    # The restored state may match an older snapshot's digest; the next one is written afresh
+    _last_snapshot.pop(workflow_name, None)
     
     print(f"✅ Rolled back workflow to snapshot: {snapshot_path}")
     return state_file_path
@@ -178,38 +543,40 @@ def normalize_step_paths(step_data):
     return step_data
 
 
-empty_step_llm = {
-    "name": "",
-    "type": "llm", 
-    "status": "",
-    "tool_name": "",
-    "batch": {
-        "in": "",
-        "upload_id": "",
-        "out": ""
-    },  
-    "data": {
-        "in": {},
-        "out": {}
-    },
-}
-
-empty_step_code = {
-    "name": "",
-    "type": "code",
-    "tool_name": "",
-    "data": {
-        "in": {},
-        "out": {}
-    },
-}
-
-empty_marker = {
-    "name": "",
-    "file_name": "",
-    "type": "",
-    "state": ""
-}
+def _new_llm_step():
+    """Return a fresh, empty LLM step (nested dicts are never shared)"""
+    return {
+        "name": "",
+        "type": "llm",
+        "status": "",
+        "tool_name": "",
+        "batch": {
+            "in": "",
+            "upload_id": "",
+            "out": ""
+        },
+        "data": {
+            "in": {},
+            "out": {}
+        },
+    }
+
+def _new_code_step():
+    """Return a fresh, empty code step (nested dicts are never shared)"""
+    return {
+        "name": "",
+        "type": "code",
+        "tool_name": "",
+        "data": {
+            "in": {},
+            "out": {}
+        },
+    }
+
+@lru_cache(maxsize=64)
+def _tool_out_head(prepare_fn, tool_name):
+    """Return (name, type) of the first output marker declared by a tool"""
+    return next(iter(prepare_fn(tool_name)["out"].items()))
 
 def create_state(state_file_path,name):
     """Create a new workflow state using DirectoryManager"""
@@ -231,6 +598,7 @@ def create_state(state_file_path,name):
     return state
 
 def create_markers(name, json_file, type_of_marker, state="created"):
+    """Build a marker node; kept as a plain dict since nodes are saved and journaled as-is"""
     return {
         "name": name,
         "file_name": json_file,
@@ -238,226 +606,243 @@ def create_markers(name, json_file, type_of_marker, state="created"):
         "state": state
     }
 
+def _journal_new_step(state, new_nodes, new_step):
+    """Append a new step, its markers and the workflow status to the state journal"""
+    events = [{"op": "set", "key": "status", "value": state["status"]}]
+    events.extend({"op": "add_node", "node": node} for node in new_nodes)
+    events.append({"op": "add_step", "step": new_step})
+    dir_manager.append_state_events(state["name"], events, state.get(STATE_GENERATION_KEY, 0))
+
+def _index_nodes(nodes):
+    """Build a name -> node lookup for a node list (in-memory only, never saved)"""
+    index = {}
+    for node in nodes:
+        # Keep the first node for a name, matching the old linear scans
+        index.setdefault(node["name"], node)
+    return index
+
+StateView = namedtuple("StateView", ["state", "nodes_by_name", "step_outputs"])
+
+def _file_signature(path):
+    """(mtime_ns, size, inode) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+@lru_cache(maxsize=32)
+def _load_state_view(state_path, state_signature, journal_signature):
+    state = dir_manager.load_json(state_path)
+    return StateView(state, _index_nodes(state["nodes"]), _index_step_outputs(state))
+
+def load_state_indexed(state_file):
+    """Read-only view of a workflow state with its node and step-output indexes.
+    
+    The parse is cached until state.json or its journal changes on disk, so
+    back-to-back reads are free. Mutators must use dir_manager.load_json instead,
+    since the returned objects are shared between callers.
+    """
+    state_path = Path(state_file).resolve()
+    return _load_state_view(
+        str(state_path),
+        _file_signature(state_path),
+        _file_signature(state_path.with_name(STATE_JOURNAL_NAME))
+    )
+
 def get_markers(state_file, marker_type=None):
-    with open(state_file, 'r') as f:
-        state = json.load(f)
+    state = load_state_indexed(state_file).state
     if marker_type:
         return [node for node in state["nodes"] if node["type"] == marker_type]
-    return state["nodes"]
+    return list(state["nodes"])
 
 def get_file_from_marker(state_file, marker):
-    with open(state_file, 'r') as f:
-        state = json.load(f)
-
-    for node in state["nodes"]:
-        if node["name"] == marker:
-            return node["file_name"]
+    node = load_state_indexed(state_file).nodes_by_name.get(marker)
+    if node is not None:
+        return node["file_name"]
     raise ValueError(f"Marker '{marker}' not found in state steps")
 
-def get_uploaded_markers(state_file):
-    with open(state_file, 'r') as f:
-        state = json.load(f)
+def get_uploaded_markers(state_file, state=None):
+    if state is None:
+        state = load_state_indexed(state_file).state
 
     return [node for node in state["nodes"] if node["state"] == "uploaded"]
 
-def get_data_from_marker_data_in(state_file, data_in, test_mode=False):
+def _load_marker_file(file_path):
+    """Parse a marker's JSON data file with a single read"""
+    return read_json(file_path)
+
+def _try_load_marker_file(file_path):
+    """Load a marker file, returning (content, error) instead of raising"""
+    try:
+        return _load_marker_file(file_path), None
+    except Exception as e:
+        return None, e
+
+def _load_marker_files(paths):
+    """Load marker files in order as (content, error) pairs, concurrently when there are several"""
+    if len(paths) > 1:
+        return list(_io_executor.map(_try_load_marker_file, paths))
+    return [_try_load_marker_file(path) for path in paths]
+
+def _limit_for_test_mode(content):
+    """Keep only the first 5 entries of marker content for test runs"""
+    if isinstance(content, dict):
+        logger.debug("🧪 TEST MODE: Limited dict to 5 entries")
+        return dict(list(content.items())[:5])
+    if isinstance(content, list):
+        logger.debug("🧪 TEST MODE: Limited list to 5 items")
+        return content[:5]
+    return content
+
+def get_data_from_marker_data_in(state_file, data_in, test_mode=False, state=None):
+    """Resolve a step's data inputs; pass the caller's already loaded state to avoid reading it again"""
     data_content = {}
+    nodes_by_name = None
     
-    for key, value in data_in.items():
+    # Values are usually marker file paths; read them all concurrently
+    values = list(data_in.values())
+    results = _load_marker_files(values)
+    
+    for (key, value), (content, error) in zip(data_in.items(), results):
         
-        print(f"🔍 DEBUG get_marker_data_and_addresses - {key} resolving marker '{value}' (test_mode: {test_mode})")
+        logger.debug("get_data_from_marker_data_in - %s resolving marker '%s' (test_mode: %s)", key, value, test_mode)
             
-        try:
-            with open(value, 'r') as f:
-                content = json.load(f)
-            data_content[key] = content
-            if test_mode:
-                    if isinstance(content, dict):
-                        content = dict(list(content.items())[:5])
-                        print(f"🧪 TEST MODE: Limited dict from full to 5 entries")
-                    elif isinstance(content, list):
-                        content = content[:5]
-                        print(f"🧪 TEST MODE: Limited list from full to 5 items")
-        except:
+        if error is None:
+            data_content[key] = _limit_for_test_mode(content) if test_mode else content
+        else:
             # find node that has the same name as the marker
             data_content[key] = value
 
-            state = dir_manager.load_json(state_file)
-            for node in state["nodes"]:
-                if node["name"] == value and node.get("state") == "single_data":
-                    data_content[key] = node["file_name"]
-                    break
+            if nodes_by_name is None:
+                nodes_by_name = _index_nodes(state["nodes"]) if state is not None else load_state_indexed(state_file).nodes_by_name
+            node = nodes_by_name.get(value)
+            if node is not None and node.get("state") == "single_data":
+                data_content[key] = node["file_name"]
 
     return data_content
         
 
 
-def get_marker_data_from_dict(state_file, marker_reference_dict, test_mode=False):
-    """Get marker data content (not file paths) with optional test mode limiting"""
-    data = {}
+def get_marker_data_and_addresses(state_file, marker_reference_dict, test_mode=False, state=None):
+    """Get both marker data content and file addresses for tools
     
-    for key, value in marker_reference_dict.items():
-        try:
-            print(f"🔍 DEBUG get_marker_data - resolving marker '{value}' (test_mode: {test_mode})")
-            
-            state = dir_manager.load_json(state_file)
-            file_path = None
-            
-            # Find the marker in nodes
-            marker_node = None
-            for node in state["nodes"]:
-                if node["name"] == value:
-                    marker_node = node
-                    break
-            
-            if marker_node:
-                file_path = marker_node["file_name"]
-            else:
-                # Try to find in completed step outputs
-                step_output_path = find_step_output_marker(state, value)
-                if step_output_path:
-                    file_path = step_output_path
-                else:
-                    raise ValueError(f"Marker '{value}' not found in state steps")
-            
-            # Load the actual content from file
-            print(f"📁 Loading data from: {file_path}")
-            with open(file_path, 'r') as f:
-                content = json.load(f)
-            
-            # Apply test mode limiting if needed
-            if test_mode:
-                if isinstance(content, dict):
-                    content = dict(list(content.items())[:5])
-                    print(f"🧪 TEST MODE: Limited dict from full to 5 entries")
-                elif isinstance(content, list):
-                    content = content[:5]
-                    print(f"🧪 TEST MODE: Limited list from full to 5 items")
-            
-            data[key] = content
-            print(f"✅ Loaded data for '{value}': {type(content)} with {len(content) if hasattr(content, '__len__') else 'N/A'} items")
-            
-        except Exception as e:
-            print(f"❌ FAILED to resolve marker '{value}': {e}")
-            # For critical failures, don't continue with bad data
-            raise e
-
-    return data
-
-def get_marker_data_and_addresses(state_file, marker_reference_dict, test_mode=False):
-    """Get both marker data content and file addresses for tools"""
+    Callers that already hold the loaded state pass it in so it is not read again.
+    """
     data_content = {}
     addresses = {}
+    # key -> (marker name, file path, is single data) for every file that still has to be read
+    pending = {}
+    
+    # Parse the state and index its nodes once for all references
+    if state is None:
+        state, nodes_by_name, step_outputs = load_state_indexed(state_file)
+    else:
+        nodes_by_name, step_outputs = _index_nodes(state["nodes"]), _index_step_outputs(state)
     
     for key, value in marker_reference_dict.items():
         try:
-            print(f"🔍 DEBUG get_marker_data_and_addresses - resolving marker '{value}' (test_mode: {test_mode})")
-            
-            state = dir_manager.load_json(state_file)
+            logger.debug("get_marker_data_and_addresses - resolving marker '%s' (test_mode: %s)", value, test_mode)
+            # Reserve the slot so results keep the order of the references
+            data_content[key] = None
             
             # Find the marker in nodes
-            marker_node = None
-            for node in state["nodes"]:
-                if node["name"] == value:
-                    marker_node = node
-                    break
+            marker_node = nodes_by_name.get(value)
             
             if marker_node and marker_node.get("state") == "single_data":
                 # Handle single data - the file_name contains the actual content
                 file_path = marker_node["file_name"]
                 addresses[key] = file_path
                 
-                # For single data, load the content from the file
-                try:
-                    with open(file_path, 'r') as f:
-                        content = json.load(f)
-                    data_content[key] = content
-                    print(f"✅ Resolved single data '{value}': {str(content)[:100]}...")
-                except Exception as e:
-                    print(f"⚠️ Failed to load single data content from {file_path}: {e}")
-                    # If we can't load from file, use the file_name as content (fallback)
+                if not isinstance(file_path, str) or is_single_data(file_path):
+                    # Inline value, nothing to read from disk
                     data_content[key] = file_path
+                    continue
+                
+                # Legacy single data stored in a file: load the content from it
+                pending[key] = (value, file_path, True)
                     
             elif marker_node:
                 # Handle regular data markers
-                file_path = marker_node["file_name"]
-                addresses[key] = file_path
-                
-                # Load the actual content from file
-                with open(file_path, 'r') as f:
-                    content = json.load(f)
-                
-                # Apply test mode limiting if needed
-                if test_mode:
-                    if isinstance(content, dict):
-                        content = dict(list(content.items())[:5])
-                        print(f"🧪 TEST MODE: Limited dict from full to 5 entries")
-                    elif isinstance(content, list):
-                        content = content[:5]
-                        print(f"🧪 TEST MODE: Limited list from full to 5 items")
-                
-                data_content[key] = content
-                print(f"✅ Loaded regular data for '{value}': {type(content)} with {len(content) if hasattr(content, '__len__') else 'N/A'} items")
+                addresses[key] = marker_node["file_name"]
+                pending[key] = (value, marker_node["file_name"], False)
                 
             else:
                 # Try to find in completed step outputs
-                step_output_path = find_step_output_marker(state, value)
+                step_output_path = find_step_output_marker(state, value, step_outputs)
                 if step_output_path:
-                    file_path = step_output_path
-                    addresses[key] = file_path
-                    
-                    # Load the actual content from file
-                    with open(file_path, 'r') as f:
-                        content = json.load(f)
-                    
-                    # Apply test mode limiting if needed
-                    if test_mode:
-                        if isinstance(content, dict):
-                            content = dict(list(content.items())[:5])
-                            print(f"🧪 TEST MODE: Limited dict from full to 5 entries")
-                        elif isinstance(content, list):
-                            content = content[:5]
-                            print(f"🧪 TEST MODE: Limited list from full to 5 items")
-                    
-                    data_content[key] = content
-                    print(f"✅ Found step output '{value}' and loaded content: {type(content)}")
+                    addresses[key] = step_output_path
+                    pending[key] = (value, step_output_path, False)
                 else:
                     raise ValueError(f"Marker '{value}' not found in state steps")
             
-            print(f"📁 File address for '{value}': {addresses[key]}")
+            logger.debug("📁 File address for '%s': %s", value, addresses[key])
             
         except Exception as e:
-            print(f"❌ FAILED to resolve marker '{value}': {e}")
+            logger.error("❌ FAILED to resolve marker '%s': %s", value, e)
             # For critical failures, raise the error
             raise e
     
+    # Marker files are independent, so read them concurrently
+    results = _load_marker_files([file_path for _, file_path, _ in pending.values()])
+    
+    for (key, (value, file_path, single_data)), (content, error) in zip(pending.items(), results):
+        if single_data:
+            if error is None:
+                data_content[key] = content
+                logger.debug("✅ Resolved single data '%s' from %s", value, file_path)
+            else:
+                logger.warning("⚠️ Failed to load single data content from %s: %s", file_path, error)
+                # If we can't load from file, use the file_name as content (fallback)
+                data_content[key] = file_path
+            continue
+        
+        if error is not None:
+            logger.error("❌ FAILED to resolve marker '%s': %s", value, error)
+            raise error
+        
+        # Apply test mode limiting if needed
+        if test_mode:
+            content = _limit_for_test_mode(content)
+        
+        data_content[key] = content
+        logger.debug("✅ Loaded data for '%s': %s", value, type(content).__name__)
+    
     return data_content, addresses
 
-def find_step_output_marker(state, marker_name):
-    """Find a marker in completed step outputs"""
+def _index_step_outputs(state):
+    """Map every name a completed step output can be referenced by to (position, path)"""
+    index = {}
+    position = 0
     for step in state.get("state_steps", []):
         if step.get("status") == "completed":
-            # Check step outputs
             for output_name, output_path in step.get("data", {}).get("out", {}).items():
                 # Handle both "step_name.output_name" and just "output_name" formats
-                if (marker_name == f"{step['name']}.{output_name}" or 
-                    marker_name == output_name or
-                    marker_name.endswith(f".{output_name}")):
-                    return output_path
-                    
-                # Also check for exact marker name match
-                full_marker_name = f"{step['name']}.{output_name}"
-                if marker_name == full_marker_name:
-                    return output_path
-    return None
+                index.setdefault(output_name, (position, output_path))
+                index.setdefault(f"{step['name']}.{output_name}", (position, output_path))
+                position += 1
+    return index
+
+def find_step_output_marker(state, marker_name, step_outputs=None):
+    """Find a marker in completed step outputs"""
+    if step_outputs is None:
+        step_outputs = _index_step_outputs(state)
+    
+    # Exact name plus every ".suffix" of it; the earliest matching step output wins
+    candidates = [marker_name] + [marker_name[i + 1:] for i, char in enumerate(marker_name) if char == "."]
+    matches = [step_outputs[candidate] for candidate in candidates if candidate in step_outputs]
+    return min(matches)[1] if matches else None
 
+@_locks_state
 def start_seed_step_streamlit(state_file, seed_file):
     """Start seed step using DirectoryManager"""
     state = dir_manager.load_json(state_file)
     workflow_name = state["name"]
+    first_new_node = len(state["nodes"])
+    batch_dir = _batch_dir(workflow_name)
 
     state["status"] = "running"
-    new_step = empty_step_llm.copy()
+    new_step = _new_llm_step()
     new_step["name"] = "seed"
     new_step["status"] = "created"
 
@@ -466,7 +851,7 @@ def start_seed_step_streamlit(state_file, seed_file):
     # Generate seed batch file
     generate_seed_batch_file(seed_file, new_step["batch"]["in"])
     # Use DirectoryManager for data file paths
-    data_dir = dir_manager.get_data_dir(workflow_name)
+    data_dir = _data_dir(workflow_name)
     new_step["data"]["out"] = {
         "user_prompt": str(data_dir / "user_prompt.json"),
         "system_prompt": str(data_dir / "system_prompt.json"), 
@@ -479,14 +864,16 @@ def start_seed_step_streamlit(state_file, seed_file):
         new_step["data"]["out"]["user_prompt"]
     )
 
-    # Create markers
-    state["nodes"].append(create_markers("system_prompt", new_step["data"]["out"]["system_prompt"], {"str":"data"}))
-    state["nodes"].append(create_markers("user_prompt", new_step["data"]["out"]["user_prompt"], {"str":"data"}))
-
     # Set TBD state - not actually uploaded yet
     new_step["batch"]["upload_id"] = "TBD"
-    new_step["batch"]["out"] = str(dir_manager.get_batch_dir(workflow_name))+ "/"+ f"{new_step['name']}_results.jsonl"
-    state["nodes"].append(create_markers("raw_seed_data", new_step["data"]["out"]["raw_seed_data"], {"str":"data"}, "pending"))
+    new_step["batch"]["out"] = str(batch_dir / f"{new_step['name']}_results.jsonl")
+
+    # Create markers
+    state["nodes"].extend([
+        create_markers("system_prompt", new_step["data"]["out"]["system_prompt"], {"str":"data"}),
+        create_markers("user_prompt", new_step["data"]["out"]["user_prompt"], {"str":"data"}),
+        create_markers("raw_seed_data", new_step["data"]["out"]["raw_seed_data"], {"str":"data"}, "pending"),
+    ])
 
     # NEW: Use 'pending' status instead of 'uploaded' for TBD state
     new_step["status"] = "pending"  # Clear indication this needs execution
@@ -508,10 +895,11 @@ def start_seed_step_streamlit(state_file, seed_file):
         # Not in Streamlit context, skip pending steps queue
         pass
     
-    # Save state using DirectoryManager
-    dir_manager.save_json(state_file, state)
+    # Journal the new step instead of rewriting the whole state
+    _journal_new_step(state, state["nodes"][first_new_node:], new_step)
     return state_file
 
+@_locks_state
 def upload_seed_step_batch(state_file, step_name):
     """Upload a seed step batch from TBD to started state"""
     try:
@@ -548,54 +936,76 @@ def upload_seed_step_batch(state_file, step_name):
         print(f"❌ Error uploading seed step batch: {e}")
         return False
 
+def _abandon_upload(upload_future):
+    """Stop a background batch upload whose step failed to set up locally."""
+    if upload_future.cancel():
+        return
+    try:
+        cancel_batch_job(upload_future.result())
+    except Exception as e:
+        print(f"⚠️  Failed to cancel orphaned batch upload: {e}")
+
+@_locks_state
 def start_seed_step(state_file, seed_file):
     """Start seed step using DirectoryManager"""
     state = dir_manager.load_json(state_file)
     workflow_name = state["name"]
+    first_new_node = len(state["nodes"])
+    batch_dir = _batch_dir(workflow_name)
 
     state["status"] = "running"
-    new_step = empty_step_llm.copy()
+    new_step = _new_llm_step()
     new_step["name"] = "seed"
     new_step["status"] = "created"
+    batch = new_step["batch"]
+    data = new_step["data"]
     
     # Use DirectoryManager for batch file path
     batch_file_path = dir_manager.get_batch_file_path(workflow_name, new_step["name"])
-    new_step["batch"]["in"] = str(batch_file_path)
+    batch["in"] = str(batch_file_path)
     
-    # Generate seed batch file
-    generate_seed_batch_file(seed_file, new_step["batch"]["in"])
+    # Generate seed batch file and start uploading it in the background
+    generate_seed_batch_file(seed_file, batch["in"])
+    upload_future = _executor.submit(upload_batch, batch["in"])
     
-    # Use DirectoryManager for data file paths
-    data_dir = dir_manager.get_data_dir(workflow_name)
-    new_step["data"]["out"] = {
-        "user_prompt": str(data_dir / "user_prompt.json"),
-        "system_prompt": str(data_dir / "system_prompt.json"), 
-        "raw_seed_data": str(data_dir / "raw_seed_data.json")
-    }
-    
-    # Convert batch data
-    convert_batch_in_to_json_data(
-        new_step["batch"]["in"], 
-        new_step["data"]["out"]["system_prompt"], 
-        new_step["data"]["out"]["user_prompt"]
-    )
-    
-    # Create markers
-    state["nodes"].append(create_markers("system_prompt", new_step["data"]["out"]["system_prompt"], {"str":"data"}))
-    state["nodes"].append(create_markers("user_prompt", new_step["data"]["out"]["user_prompt"], {"str":"data"}))
-    
-    # Upload batch
-    new_step["batch"]["upload_id"] = upload_batch(new_step["batch"]["in"])
-    new_step["batch"]["out"] = str(dir_manager.get_batch_dir(workflow_name))+ "/"+ f"{new_step['name']}_results.jsonl"
-    
-    state["nodes"].append(create_markers("raw_seed_data", new_step["data"]["out"]["raw_seed_data"], {"str":"data"}, "uploaded"))
+    # The upload overlaps the local setup below; a failure there must not leave an orphaned batch
+    try:
+        # Use DirectoryManager for data file paths
+        data_dir = _data_dir(workflow_name)
+        data["out"] = {
+            "user_prompt": str(data_dir / "user_prompt.json"),
+            "system_prompt": str(data_dir / "system_prompt.json"), 
+            "raw_seed_data": str(data_dir / "raw_seed_data.json")
+        }
+    
+        # Convert batch data
+        convert_batch_in_to_json_data(
+            batch["in"], 
+            data["out"]["system_prompt"], 
+            data["out"]["user_prompt"]
+        )
+    
+        # Create markers
+        state["nodes"].extend([
+            create_markers("system_prompt", data["out"]["system_prompt"], {"str":"data"}),
+            create_markers("user_prompt", data["out"]["user_prompt"], {"str":"data"}),
+            create_markers("raw_seed_data", data["out"]["raw_seed_data"], {"str":"data"}, "uploaded"),
+        ])
+    except Exception:
+        _abandon_upload(upload_future)
+        raise
+    
+    # Wait for the batch upload
+    batch["upload_id"] = upload_future.result()
+    batch["out"] = str(batch_dir / f"{new_step['name']}_results.jsonl")
     
     new_step["status"] = "uploaded"
     state["state_steps"].append(new_step)
-    # Save state using DirectoryManager
-    dir_manager.save_json(state_file, state)
+    # Journal the new step instead of rewriting the whole state
+    _journal_new_step(state, state["nodes"][first_new_node:], new_step)
     return state_file
 
+@_locks_state
 def complete_running_step(state_file):
     """Complete running step using DirectoryManager"""
     state = dir_manager.load_json(state_file)
@@ -605,62 +1015,56 @@ def complete_running_step(state_file):
         raise ValueError("State is not running")
     
     last_step = state["state_steps"][-1]
+    batch = last_step["batch"]
+    step_data = last_step["data"]
 
-    if last_step["batch"]["upload_id"] == "TBD":
-        last_step["batch"]["upload_id"] = upload_batch(last_step["batch"]["in"])
+    if batch["upload_id"] == "TBD":
+        batch["upload_id"] = upload_batch(batch["in"])
         last_step["status"] = "uploaded"
         state["status"] = "running"
         dir_manager.save_json(state_file, state)
         return "Seed step uploaded, waiting for batch processing.", {}
     
     
-    batch_id = last_step["batch"]["upload_id"]
-    print(f"Checking step: {last_step['name']} with batch ID: {batch_id}")
+    batch_id = batch["upload_id"]
+    logger.debug("Checking step: %s with batch ID: %s", last_step['name'], batch_id)
     
     
     status, counts = check_batch_job(batch_id)
-
-    print(status)
+    logger.debug("Batch %s status: %s", batch_id, status)
 
     if status == "completed" or status == "expired":
         
-        print("Batch job completed successfully")
-
-        # Use DirectoryManager for batch results path
-        batch_results_path = dir_manager.get_batch_dir(workflow_name) / f"{last_step['name']}_results.jsonl"
-        last_step["batch"]["out"] = str(batch_results_path)
-        
-        # Download batch results
-        download_batch_results(batch_id, last_step["batch"]["out"])
-
-        print("Downloaded Batch Results")
+        logger.info("Batch job %s finished with status %s", batch_id, status)
 
-        # Use DirectoryManager for data output path
+        # Download to the results path recorded when the step was created
+        if not batch.get("out"):
+            batch["out"] = str(_batch_dir(workflow_name) / f"{last_step['name']}_results.jsonl")
         
+        # Results are parsed while the download streams in
         if state["status"] == "running_chip":
-            relevant_markers = get_uploaded_markers(state_file)
-            cache_batch_data, status_step = convert_batch_out_to_json_data(last_step["batch"]["out"], None)
-            final_data = finish_chip_tool(chip_name=last_step["tool_name"],data=get_data_from_marker_data_in(state_file, last_step["data"]["in"]), batch_data=cache_batch_data)
-            save_chip_results(last_step["tool_name"], final_data, last_step["data"]["out"])
+            relevant_markers = _index_nodes(node for node in state["nodes"] if node["state"] == "uploaded")
+            cache_batch_data, status_step = download_and_convert_batch_results(batch_id, batch["out"], None)
+            logger.debug("Downloaded batch results to %s", batch["out"])
+            final_data = finish_chip_tool(chip_name=last_step["tool_name"],data=get_data_from_marker_data_in(state_file, step_data["in"], state=state), batch_data=cache_batch_data)
+            save_chip_results(last_step["tool_name"], final_data, step_data["out"])
             # update output markers
-            for output_marker_name, data in last_step["data"]["out"].items():
+            for output_marker_name, data in step_data["out"].items():
                 #output_marker_name = last_step["name"] + "_" + output_marker_name
-                current_marker = (next(d for d in relevant_markers if d['name'] == output_marker_name))
-                current_marker["state"] = status_step
-                (next(d for d in state["nodes"] if d['name'] == current_marker['name'])).update(current_marker)
+                relevant_markers[output_marker_name]["state"] = status_step
             last_step["status"] = status_step
-            print("Chip processing completed")
+            logger.debug("Chip processing completed")
         else:
-            output_marker = get_uploaded_markers(state_file)[-1]
-            # Convert batch output to JSON data
-            data, status_step = convert_batch_out_to_json_data(last_step["batch"]["out"], last_step["data"]["out"][output_marker["name"]])
+            # The step's output is the newest uploaded marker, so scan from the end
+            output_marker = next(node for node in reversed(state["nodes"]) if node["state"] == "uploaded")
+            # Download and convert batch output to JSON data
+            data, status_step = download_and_convert_batch_results(batch_id, batch["out"], step_data["out"][output_marker["name"]])
+            logger.debug("Downloaded batch results to %s", batch["out"])
 
             # Update the state file with the new data
             output_marker["state"] = status_step  # Fix: Update marker to point to extracted file
-            (next(d for d in state["nodes"] if d['name'] == output_marker['name'])).update(output_marker)
             last_step["status"] =   status_step
 
-        print("completed")
         if status == "expired":
             state["status"] = "corrupted"
         else:
@@ -672,13 +1076,12 @@ def complete_running_step(state_file):
         
     elif status == "failed":
         last_step["status"] = "failed"
-        last_step["batch"]["out"] = None
+        batch["out"] = None
         state["status"] = "failed"  
         
         # Save state using DirectoryManager
         dir_manager.save_json(state_file, state)
-        print("Batch job failed")
-        print("Error details:", counts)
+        logger.warning("Batch job %s failed: %s", batch_id, counts)
         return "Batch job failed:", counts.get("error", "Unknown error")
     elif status == "finalizing":
         last_step["status"] = "in_progress"
@@ -688,23 +1091,26 @@ def complete_running_step(state_file):
         return "Batch job is still in progress:", counts
 
 
+@_locks_state
 def use_llm_tool(state_file, custom_name, tool_name, reference_dict, test_mode=False):
     """Use LLM tool with DirectoryManager and progress tracking"""
     
-    # Create snapshot before operation
+    state = dir_manager.load_json(state_file)
+    workflow_name = state["name"]
+    first_new_node = len(state["nodes"])
+    batch_dir = _batch_dir(workflow_name)
+    
+    # Snapshot the pre-operation state; the file is written in the background
     try:
-        create_workflow_snapshot(state_file)
+        create_workflow_snapshot_async(state)
     except Exception as e:
         print(f"⚠️  Failed to create snapshot: {e}")
-    
-    state = dir_manager.load_json(state_file)
-    workflow_name = state["name"]
 
-    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode)
+    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode, state=state)
 
     state["status"] = "running"
     
-    new_step = empty_step_llm.copy()
+    new_step = _new_llm_step()
     new_step["name"] = custom_name
     new_step["status"] = "created"
     new_step["tool_name"] = tool_name
@@ -714,152 +1120,160 @@ def use_llm_tool(state_file, custom_name, tool_name, reference_dict, test_mode=F
     new_step["batch"]["in"] = str(batch_file_path)
     new_step["data"]["in"] = addresses
     
-    # Generate LLM batch file
+    # Generate LLM batch file and start uploading it in the background
     generate_llm_tool_batch_file(tool_name, data_content, new_step["batch"]["in"])
+    upload_future = _executor.submit(upload_batch, new_step["batch"]["in"])
     
-    # Prepare output data
-    out = prepare_data(tool_name)["out"]
-    first_key = next(iter(out.keys()))
-    first_value = out[first_key]
-    output_markers = {"name": str(first_key), "type": first_value}
-    
-    # Upload batch
-    new_step["batch"]["upload_id"] = upload_batch(new_step["batch"]["in"])
+    # The upload overlaps the local setup below; a failure there must not leave an orphaned batch
+    try:
+        # Prepare output data
+        first_key, first_value = _tool_out_head(prepare_data, tool_name)
+        output_markers = {"name": str(first_key), "type": first_value}
+        output_name = f"{new_step['name']}_{output_markers['name']}"
     
-    # Use DirectoryManager for batch output path
-    batch_output_path = dir_manager.get_batch_dir(workflow_name) / f"{new_step['name']}_{output_markers['name']}.jsonl"
-    new_step["batch"]["out"] = str(batch_output_path)
+        # Use DirectoryManager for batch output path
+        new_step["batch"]["out"] = str(batch_dir / f"{output_name}.jsonl")
     
-    # Use DirectoryManager for data output path
-    data_output_path = dir_manager.get_data_file_path(workflow_name, f"{new_step['name']}_{output_markers['name']}", "extracted")
-    new_step["data"]["out"] = {str(new_step['name'] + "_" + output_markers["name"]): str(data_output_path)}
+        # Use DirectoryManager for data output path
+        data_output_path = str(dir_manager.get_data_file_path(workflow_name, output_name, "extracted"))
+        new_step["data"]["out"] = {output_name: data_output_path}
 
-    # Create marker
-    state["nodes"].append(create_markers(str(new_step['name'] + "_" + output_markers["name"]), new_step["data"]["out"][output_markers["name"]], output_markers["type"], "uploaded"))
+        # Create marker
+        state["nodes"].append(create_markers(output_name, data_output_path, output_markers["type"], "uploaded"))
+    except Exception:
+        _abandon_upload(upload_future)
+        raise
     
+    # Wait for the batch upload
+    new_step["batch"]["upload_id"] = upload_future.result()
     new_step["status"] = "uploaded"
     state["state_steps"].append(new_step)
     
-    # Save state using DirectoryManager
-    dir_manager.save_json(state_file, state)
+    # Journal the new step instead of rewriting the whole state
+    _journal_new_step(state, state["nodes"][first_new_node:], new_step)
     return state_file
 
 
+@_locks_state
 def use_code_tool(state_file, custom_name, tool_name, reference_dict, test_mode=False):
     """Use code tool with DirectoryManager and progress tracking"""
     
-    # Create snapshot before operation  
-    try:
-        create_workflow_snapshot(state_file)
-    except Exception as e:
-        print(f"⚠️  Failed to create snapshot: {e}")
-    
-    print(f"🔍 DEBUG - Code tool execution (test_mode: {test_mode})")
+    logger.debug("Code tool execution (test_mode: %s)", test_mode)
     
     state = dir_manager.load_json(state_file)
     workflow_name = state["name"]
+    first_new_node = len(state["nodes"])
+    
+    # Snapshot the pre-operation state; the file is written in the background
+    try:
+        create_workflow_snapshot_async(state)
+    except Exception as e:
+        print(f"⚠️  Failed to create snapshot: {e}")
 
-    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode)
+    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode, state=state)
     state["status"] = "running"
     
-    new_step = empty_step_code.copy()
+    new_step = _new_code_step()
     new_step["name"] = custom_name
     new_step["status"] = "created"
     new_step["tool_name"] = tool_name
     new_step["data"]["in"] = addresses
     
     # Prepare output data
-    out = prepare_tool_use(tool_name)["out"]
-    first_key = next(iter(out.keys()))
-    first_value = out[first_key]
+    first_key, first_value = _tool_out_head(prepare_tool_use, tool_name)
     output_markers = {"name": str(first_key), "type": first_value}
+    output_name = f"{new_step['name']}_{output_markers['name']}"
     
     if tool_name == "finalize":
         # Use DirectoryManager for dataset versioning
         dataset_result = execute_code_tool(tool_name, data_content)
 
         # Create a new dataset version
-        version_name = f"finalized_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        version_name = f"finalized_{time.strftime('%Y%m%d_%H%M%S')}"
         
         # Save the dataset using DirectoryManager
         if isinstance(dataset_result, Dataset):
             saved_info = dir_manager.save_huggingface_dataset(workflow_name, dataset_result, version_name)
-            new_step["data"]["out"] = {str(new_step['name'] + "_" + output_markers["name"]): saved_info['version_dir']}
+            data_output_path = saved_info['version_dir']
         else:
             # For non-Dataset results, save to datasets directory
-            version_dir = dir_manager.create_dataset_version_dir(workflow_name, version_name)
-            save_code_tool_results(tool_name, dataset_result, str(version_dir))
-            new_step["data"]["out"] = {str(new_step['name'] + "_" + output_markers["name"]): str(version_dir)}
+            data_output_path = str(dir_manager.create_dataset_version_dir(workflow_name, version_name))
+            save_code_tool_results(tool_name, dataset_result, data_output_path)
         
-        state["nodes"].append(create_markers(str(new_step['name'] + "_" + output_markers["name"]), new_step["data"]["out"][output_markers["name"]], output_markers["type"]))
+        new_step["data"]["out"] = {output_name: data_output_path}
+        state["nodes"].append(create_markers(output_name, data_output_path, output_markers["type"]))
         new_step["status"] = "completed"
         state["status"] = "finalized"
     else:
         # Use DirectoryManager for regular data output
-        data_output_path = dir_manager.get_data_file_path(workflow_name, f"{new_step['name']}_{output_markers['name']}", "processed")
+        data_output_path = str(dir_manager.get_data_file_path(workflow_name, output_name, "processed"))
         
         # Execute and save results
         result = execute_code_tool(tool_name, data_content)
-        save_code_tool_results(tool_name, result, str(data_output_path))
+        save_code_tool_results(tool_name, result, data_output_path)
 
-        new_step["data"]["out"] = {str(new_step['name'] + "_" + output_markers["name"]): str(data_output_path)}
-        state["nodes"].append(create_markers(str(new_step['name'] + "_" + output_markers["name"]), new_step["data"]["out"][output_markers["name"]], output_markers["type"]))
+        new_step["data"]["out"] = {output_name: data_output_path}
+        state["nodes"].append(create_markers(output_name, data_output_path, output_markers["type"]))
         new_step["status"] = "completed"
         state["status"] = "completed"
     
     state["state_steps"].append(new_step)
     
-    # Save state using DirectoryManager
-    dir_manager.save_json(state_file, state)
+    # Journal the new step instead of rewriting the whole state
+    _journal_new_step(state, state["nodes"][first_new_node:], new_step)
     return state_file
 
+@_locks_state
 def use_chip(state_file, custom_name, chip_name, reference_dict, test_mode=False):
     """Use chip with DirectoryManager and progress tracking"""
-    # Create snapshot before operation
-    try:
-        create_workflow_snapshot(state_file)
-    except Exception as e:
-        print(f" Failed to create snapshot: {e}")
-    
     state = dir_manager.load_json(state_file)
     workflow_name = state["name"]
+    first_new_node = len(state["nodes"])
+    batch_dir = _batch_dir(workflow_name)
+    
+    # Snapshot the pre-operation state; the file is written in the background
+    try:
+        create_workflow_snapshot_async(state)
+    except Exception as e:
+        print(f"⚠️  Failed to create snapshot: {e}")
 
-    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode)
+    data_content, addresses = get_marker_data_and_addresses(state_file, reference_dict, test_mode=test_mode, state=state)
     state["status"] = "running_chip"
     
-    new_step = empty_step_llm.copy()  # Use LLM template since chips use batches
+    new_step = _new_llm_step()  # Use LLM template since chips use batches
     new_step["name"] = custom_name
     new_step["status"] = "created"
     new_step["tool_name"] = chip_name
     new_step["type"] = "chip"  # Add chip type identifier
+    batch = new_step["batch"]
+    data = new_step["data"]
 
-    batch_file_path = dir_manager.get_batch_file_path(workflow_name, new_step["name"])
-    new_step["batch"]["in"] = str(batch_file_path)
-    new_step["data"]["in"] = addresses
+    batch_file_path = dir_manager.get_batch_file_path(workflow_name, custom_name)
+    batch["in"] = str(batch_file_path)
+    data["in"] = addresses
 
     # Start the chip tool
     output_markers = start_chip_tool(chip_name, data_content, batch_file_path)
 
     # Batch management
-    new_step["batch"]["upload_id"] = upload_batch(new_step["batch"]["in"])
+    batch["upload_id"] = upload_batch(batch["in"])
     
     # Handle multiple output markers properly
     output_paths = {}
+    new_markers = []
     for key, value in output_markers.items():
-        new_name = new_step['name'] + "_" + key
-        data_output_path = dir_manager.get_data_file_path(workflow_name, new_name, "extracted")
-        output_paths[new_name] = str(data_output_path)
-
-        # Create each marker
-        state["nodes"].append(create_markers(new_name, output_paths[new_name], value, "uploaded"))
+        new_name = f"{custom_name}_{key}"
+        output_paths[new_name] = str(dir_manager.get_data_file_path(workflow_name, new_name, "extracted"))
+        new_markers.append(create_markers(new_name, output_paths[new_name], value, "uploaded"))
+    state["nodes"].extend(new_markers)
 
-    new_step["data"]["out"] = output_paths
-    new_step["batch"]["out"] = str(dir_manager.get_batch_dir(workflow_name) / f"{new_step['name']}_results.jsonl")
+    data["out"] = output_paths
+    batch["out"] = str(batch_dir / f"{custom_name}_results.jsonl")
     new_step["status"] = "uploaded"
     state["state_steps"].append(new_step)
     
-    # Save state using DirectoryManager
-    dir_manager.save_json(state_file, state)
+    # Journal the new step instead of rewriting the whole state
+    _journal_new_step(state, state["nodes"][first_new_node:], new_step)
     return state_file
 
 
@@ -877,62 +1291,210 @@ def load_workflow_dataset(workflow_name, version_name):
 
 # Additional helper functions for the new DirectoryManager
 
+FileInfo = namedtuple("FileInfo", ["name", "path", "size", "mtime"])
+
+def _file_info_dict(info):
+    """Dict form of a FileInfo returned by the public listing helpers"""
+    return {
+        'name': info.name,
+        'path': info.path,
+        'size': info.size,
+        'mtime': info.mtime,
+        'modified': iso_timestamp(info.mtime)
+    }
+
+def _scan_files(directory, suffix):
+    """Yield the DirEntry of each file ending in suffix.
+    
+    Shared by the listing and cleanup helpers; a missing directory yields nothing.
+    """
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    
+    with entries:
+        for entry in entries:
+            # Name checks use no syscalls and is_file() uses the d_type from the directory read
+            if entry.name.endswith(suffix) and entry.is_file():
+                yield entry
+
+def _iter_workflow_files(directory, suffix):
+    """Yield a FileInfo for each file ending in suffix as the directory is read"""
+    for entry in _scan_files(directory, suffix):
+        # scandir entries carry their stat result, so each file costs a single syscall
+        stat = entry.stat()
+        yield FileInfo(entry.name[:-len(suffix)], entry.path, stat.st_size, stat.st_mtime)
+
+def _list_workflow_files(directory, suffix):
+    """List files ending in suffix with size and mtime"""
+    return [_file_info_dict(info) for info in _iter_workflow_files(directory, suffix)]
+
 def get_workflow_batch_files(workflow_name):
     """Get all batch files for a workflow"""
-    batch_dir = dir_manager.get_batch_dir(workflow_name)
-    batch_files = []
-    
-    if batch_dir.exists():
-        for batch_file in batch_dir.glob("*.jsonl"):
-            batch_files.append({
-                'name': batch_file.stem,
-                'path': str(batch_file),
-                'size': batch_file.stat().st_size,
-                'modified': datetime.datetime.fromtimestamp(batch_file.stat().st_mtime).isoformat()
-            })
-    
-    return batch_files
+    return _list_workflow_files(_batch_dir(workflow_name), ".jsonl")
 
 def get_workflow_data_files(workflow_name):
     """Get all data files for a workflow"""
-    data_dir = dir_manager.get_data_dir(workflow_name)
-    data_files = []
-    
-    if data_dir.exists():
-        for data_file in data_dir.glob("*.json"):
-            data_files.append({
-                'name': data_file.stem,
-                'path': str(data_file),
-                'size': data_file.stat().st_size,
-                'modified': datetime.datetime.fromtimestamp(data_file.stat().st_mtime).isoformat()
-            })
-    
-    return data_files
+    return _list_workflow_files(_data_dir(workflow_name), ".json")
 
 def clean_workflow_temp_files(workflow_name):
     """Clean temporary files for a workflow"""
-    batch_dir = dir_manager.get_batch_dir(workflow_name)
+    batch_dir = _batch_dir(workflow_name)
     
     # Remove temporary batch files (but keep results)
-    for temp_file in batch_dir.glob("*_temp.jsonl"):
-        temp_file.unlink()
-        print(f"Removed temp file: {temp_file}")
+    removed = [entry.path for entry in _scan_files(batch_dir, "_temp.jsonl")]
+    
+    # Unlinks are independent, so larger cleanups overlap them like exports do
+    if len(removed) > 16:
+        list(_io_executor.map(os.unlink, removed))
+    else:
+        for path in removed:
+            os.unlink(path)
+    
+    if removed:
+        print("\n".join(f"Removed temp file: {path}" for path in removed))
+
+# ioctl request that makes a file share another file's extents copy-on-write (Linux)
+FICLONE = 0x40049409
 
-def export_workflow_data(workflow_name, export_path):
-    """Export all workflow data to a specified path"""
-    workflow_path = dir_manager.get_workflow_path(workflow_name)
+def _clone_file(src, dst):
+    """Reflink dst to src on CoW filesystems (btrfs, XFS); raises OSError where unsupported"""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError("reflink not supported on this platform")
+    # Exclusive create: never truncate an existing file that may share data with src
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def _fast_copy2(src, dst):
+    """copy2 that moves bytes with copy_file_range, so they never pass through user space"""
+    if not hasattr(os, "copy_file_range"):
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except OSError:
+        # e.g. EXDEV on kernels before 5.3; shutil falls back to sendfile or read/write
+        return shutil.copy2(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+def _link_or_copy(src, dst, link=False):
+    """Reflink a file, else hardlink it on the same filesystem (unless link is False), else copy it"""
+    try:
+        _clone_file(src, dst)
+        return dst
+    except OSError:
+        pass
+    try:
+        if not link:
+            raise OSError("hardlinks disabled")
+        os.link(src, dst)
+    except OSError:
+        # Cross-device or unsupported: copy in-kernel where possible
+        _fast_copy2(src, dst)
+    return dst
+
+def _export_file(src, dst, link=False):
+    """Export one file, skipping it when dst already holds the same file from an earlier export"""
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return _link_or_copy(src, dst, link)
+    
+    src_stat = os.stat(src)
+    same_inode = (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino)
+    # A hardlink from an earlier export is only up to date if links are still wanted
+    if (same_inode and link) or (not same_inode and (src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns)):
+        return dst
+    
+    # Unlink rather than overwrite: a stale dst may be a hardlink into another export
+    os.unlink(dst)
+    return _link_or_copy(src, dst, link)
+
+def _is_export_ignored(name):
+    """Files and directories that never belong in an export"""
+    return name.endswith("_temp.jsonl") or name in ("__pycache__", ".DS_Store", STATE_LOCK_NAME)
+
+# Export paths with these suffixes are written as a single streamed archive
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz")
+
+def _export_workflow_archive(workflow_path, workflow_name, archive_path):
+    """Stream a workflow directory into one tar archive (gzip for .tar.gz/.tgz)"""
+    mode = "w|" if archive_path.name.endswith(".tar") else "w|gz"
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    def skip_ignored(info):
+        return None if _is_export_ignored(os.path.basename(info.name)) else info
+    
+    with tarfile.open(str(archive_path), mode) as tar:
+        tar.add(workflow_path, arcname=workflow_name, filter=skip_ignored)
+    return str(archive_path)
+
+def export_workflow_data(workflow_name, export_path, link=False):
+    """Export all workflow data to a specified path.
+    
+    An export_path ending in .tar, .tar.gz or .tgz produces a single archive, which is far
+    cheaper than many small files on network mounts; the archive path is returned then.
+    
+    Files are reflinked where the filesystem supports it and copied otherwise. Pass link=True
+    to hardlink them on the same filesystem instead; such an export shares inodes with the
+    workflow, so files the app later rewrites in place change in the export too.
+    """
+    workflow_path = _workflow_path(workflow_name)
     export_path = Path(export_path)
     
-    # Copy entire workflow directory
-    import shutil
-    shutil.copytree(workflow_path, export_path / workflow_name)
+    # Exporting into the workflow itself would copy the export into itself
+    source = workflow_path.resolve()
+    try:
+        nested = os.path.commonpath([source, (export_path / workflow_name).resolve()]) == str(source)
+    except ValueError:
+        # Different drives on Windows: the export cannot be inside the workflow
+        nested = False
+    if nested:
+        raise ValueError(f"Cannot export workflow '{workflow_name}' into its own directory: {export_path}")
+    
+    if export_path.name.endswith(ARCHIVE_SUFFIXES):
+        archive = _export_workflow_archive(workflow_path, workflow_name, export_path)
+        print(f"Exported workflow '{workflow_name}' to: {archive}")
+        return archive
+    
+    target_path = export_path / workflow_name
+    
+    # Recreate the directory tree first, then copy the files
+    copies = []
+    for root, dirs, files in os.walk(workflow_path):
+        # Pruning dirs in place keeps os.walk from descending into them
+        dirs[:] = [name for name in dirs if not _is_export_ignored(name)]
+        target_root = target_path / os.path.relpath(root, workflow_path)
+        os.makedirs(target_root, exist_ok=True)
+        # The journal is appended to in place, so a hardlink would pick up later events
+        copies.extend((os.path.join(root, file_name), target_root / file_name, link and file_name != STATE_JOURNAL_NAME)
+                      for file_name in files if not _is_export_ignored(file_name))
+    
+    # Files are independent, so larger exports copy them concurrently
+    if len(copies) > 16:
+        list(_io_executor.map(lambda copy: _export_file(*copy), copies))
+    else:
+        for src, dst, link_file in copies:
+            _export_file(src, dst, link_file)
     
     print(f"Exported workflow '{workflow_name}' to: {export_path / workflow_name}")
     return str(export_path / workflow_name)
 
 def get_deletable_steps(state_file):
     """Returns a list of names of completed steps."""
-    state = dir_manager.load_json(state_file)
+    state = load_state_indexed(state_file).state
     completed_steps = []
     for step in state.get('state_steps', []):
         if step.get('status') == 'completed' or step.get('status') == 'failed' or step.get('status') == 'corrupted' or step.get('status') == 'cancelled':
@@ -941,13 +1503,14 @@ def get_deletable_steps(state_file):
 
 def get_uploaded_steps(state_file):
     """Returns a list of names of steps that are uploaded or in progress."""
-    state = dir_manager.load_json(state_file)
+    state = load_state_indexed(state_file).state
     uploaded_steps = []
     for step in state.get('state_steps', []):
         if step.get('status') == 'uploaded':
             uploaded_steps.append(step.get('name'))
     return uploaded_steps
 
+@_locks_state
 def delete_step(state_file, step_name_to_delete):
     """Deletes a completed step from the workflow state and cleans up its output markers."""
     state = dir_manager.load_json(state_file)
@@ -963,11 +1526,11 @@ def delete_step(state_file, step_name_to_delete):
         
     if step_to_delete.get('status') == 'uploaded' or step_to_delete.get('status') == 'in_progress':
         raise ValueError(f"Cannot delete step '{step_name_to_delete}' as it is not completed. Its status is '{step_to_delete.get('status')}'.")
-
-    # Get the output markers of the step to be deleted
-    output_markers_to_remove = []
+    
+    # Get the output markers of the step to be deleted; a set keeps the node filter linear
+    output_markers_to_remove = set()
     if 'data' in step_to_delete and 'out' in step_to_delete['data']:
-        output_markers_to_remove = list(step_to_delete['data']['out'].keys())
+        output_markers_to_remove = set(step_to_delete['data']['out'])
 
     # Remove the step from state_steps
     state['state_steps'] = [step for step in state['state_steps'] if step['name'] != step_name_to_delete]
@@ -981,6 +1544,7 @@ def delete_step(state_file, step_name_to_delete):
     
     return f"Step '{step_name_to_delete}' deleted successfully."
 
+@_locks_state
 def cancel_step_batch(state_file, selected_step):
     """Cancel the batch job of a the selected step. raises an error if the step is not uploaded."""
     state = dir_manager.load_json(state_file)
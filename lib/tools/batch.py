@@ -1,13 +1,17 @@
 import os
+import logging
 from dotenv import load_dotenv
 from openai import OpenAI
 import json
+from lib.directory_manager import json_loads, json_dumps
 
 # Load environment variables from .env file
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=api_key)
 
+logger = logging.getLogger(__name__)
+
 def upload_batch(batch_filename):
   file = open(batch_filename, "rb")
   batch_file = client.files.create(
@@ -33,18 +37,37 @@ def check_batch_job(batch_id):
 def download_batch_results(batch_id, result_file_name):
   batch_job = client.batches.retrieve(batch_id)
   result_file_id = batch_job.output_file_id
-  print(f"🔍 DEBUG - Result file ID: {batch_job}")
+  logger.debug("🔍 Result file ID for batch %s: %s", batch_id, result_file_id)
   result = client.files.content(result_file_id).content
   with open(result_file_name, 'wb') as file:
       file.write(result)
 
+def stream_batch_results(batch_id, result_file_name):
+  """Download batch results to disk, yielding each complete JSONL line as soon as it arrives"""
+  batch_job = client.batches.retrieve(batch_id)
+  result_file_id = batch_job.output_file_id
+  pending = b""
+  with client.files.with_streaming_response.content(result_file_id) as response, open(result_file_name, 'wb') as file:
+      for chunk in response.iter_bytes():
+          file.write(chunk)
+          pending += chunk
+          *lines, pending = pending.split(b"\n")
+          for line in lines:
+              yield line.decode('utf-8')
+  if pending:
+      yield pending.decode('utf-8')
+
+def download_and_convert_batch_results(batch_id, result_file_name, output_file=None):
+  """Download batch results and parse them while the download is still streaming in"""
+  return convert_batch_out_lines_to_json_data(stream_batch_results(batch_id, result_file_name), output_file)
+
 def convert_batch_in_to_json_data(batch_file, input_sys_file, input_user_file):
     if isinstance(batch_file, tuple) or isinstance(batch_file, list):
         batch = [json.dumps(line) for line in batch_file]
         batch = [json.loads(line) for line in batch]
     else:
-        with open(batch_file, 'r') as f:
-            batch = [json.loads(line) for line in f.readlines()]
+        with open(batch_file, 'rb') as f:
+            batch = [json_loads(line) for line in f]
     
     input_data_A = {}
     input_data_B = {}
@@ -58,11 +81,11 @@ def convert_batch_in_to_json_data(batch_file, input_sys_file, input_user_file):
     
     if input_sys_file is None or input_user_file is None:
         return input_data_A, input_data_B
-    with open(input_sys_file, 'w') as f:
-        json.dump(input_data_A, f)
+    with open(input_sys_file, 'wb') as f:
+        f.write(json_dumps(input_data_A))
     
-    with open(input_user_file, 'w') as f:
-        json.dump(input_data_B, f)
+    with open(input_user_file, 'wb') as f:
+        f.write(json_dumps(input_data_B))
 
 def convert_batch_out_to_json_data(batch_file, output_file=None):
     """
@@ -80,69 +103,77 @@ def convert_batch_out_to_json_data(batch_file, output_file=None):
               - output_data (dict): Dictionary of custom_id: text_content (as strings)
               - status (str): 'completed', 'corrupted', or 'empty'
     """
+    if not os.path.exists(batch_file) or os.path.getsize(batch_file) == 0:
+        return {}, "empty"
+
+    with open(batch_file, 'r', encoding='utf-8') as f:
+        return convert_batch_out_lines_to_json_data(f, output_file)
+
+def convert_batch_out_lines_to_json_data(lines, output_file=None):
+    """Same as convert_batch_out_to_json_data, but parses any iterable of JSONL lines."""
     output_data = {}
     errors = []
     status = "completed"
     total_lines = 0
 
-    if not os.path.exists(batch_file) or os.path.getsize(batch_file) == 0:
-        return {}, "empty"
+    for i, line in enumerate(lines, 1):
+        total_lines += 1
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            b = json_loads(line)
+            custom_id = b.get("custom_id")
+            
+            # Check for top-level errors or non-200 status codes
+            if b.get("error") or "response" not in b or b["response"].get("status_code") != 200:
+                status = "corrupted"
+                error_details = b.get("error", f"Non-200 status or malformed response for custom_id: {custom_id}")
+                errors.append(f"Line {i}: API Error - {error_details}")
+                continue
 
-    with open(batch_file, 'r', encoding='utf-8') as f:
-        for i, line in enumerate(f, 1):
-            total_lines += 1
-            line = line.strip()
-            if not line:
+            response_body = b["response"]["body"]
+            
+            # Find the message content
+            text_content = None
+            if "output" in response_body and isinstance(response_body.get("output"), list):
+                for output_item in response_body["output"]:
+                    if (output_item.get("type") == "message" and 
+                        isinstance(output_item.get("content"), list) and 
+                        len(output_item["content"]) > 0 and
+                        output_item["content"][0].get("type") == "output_text"):
+                        text_content = output_item["content"][0].get("text")
+                        break
+            
+            if text_content is None:
+                status = "corrupted"
+                errors.append(f"Line {i}: Could not find 'text' content for custom_id: {custom_id}")
                 continue
 
-            try:
-                b = json.loads(line)
-                custom_id = b.get("custom_id")
-                
-                # Check for top-level errors or non-200 status codes
-                if b.get("error") or "response" not in b or b["response"].get("status_code") != 200:
-                    status = "corrupted"
-                    error_details = b.get("error", f"Non-200 status or malformed response for custom_id: {custom_id}")
-                    errors.append(f"Line {i}: API Error - {error_details}")
-                    continue
-
-                response_body = b["response"]["body"]
-                
-                # Find the message content
-                text_content = None
-                if "output" in response_body and isinstance(response_body.get("output"), list):
-                    for output_item in response_body["output"]:
-                        if (output_item.get("type") == "message" and 
-                            isinstance(output_item.get("content"), list) and 
-                            len(output_item["content"]) > 0 and
-                            output_item["content"][0].get("type") == "output_text"):
-                            text_content = output_item["content"][0].get("text")
-                            break
-                
-                if text_content is None:
-                    status = "corrupted"
-                    errors.append(f"Line {i}: Could not find 'text' content for custom_id: {custom_id}")
-                    continue
-
-                # Store ALL text content as string, regardless of whether it's valid JSON
-                output_data[custom_id] = text_content
-                
-                # Optional: Just log if it's not valid JSON (but don't treat as error)
+            # Store ALL text content as string, regardless of whether it's valid JSON
+            output_data[custom_id] = text_content
+            
+            # Optional: Just log if it's not valid JSON (but don't treat as error); only parse when debugging
+            if logger.isEnabledFor(logging.DEBUG):
                 try:
                     json.loads(text_content)
-                    print(f"✅ Line {i}: Valid JSON content for custom_id: {custom_id}")
+                    logger.debug("✅ Line %s: Valid JSON content for custom_id: %s", i, custom_id)
                 except json.JSONDecodeError:
-                    print(f"ℹ️ Line {i}: Plain text content for custom_id: {custom_id} (not JSON, but that's OK)")
+                    logger.debug("ℹ️ Line %s: Plain text content for custom_id: %s (not JSON, but that's OK)", i, custom_id)
+
+        except json.JSONDecodeError as e:
+            # Handle cursed LLM content that breaks the JSONL line
+            status = "corrupted"
+            errors.append(f"Line {i}: Failed to decode JSONL line (possibly cursed LLM output). Error: {e}. Content preview: '{line[:200]}...'")
+            
+        except Exception as e:
+            status = "corrupted"
+            errors.append(f"Line {i}: An unexpected error occurred: {str(e)}")
+
+    if total_lines == 0:
+        return {}, "empty"
 
-            except json.JSONDecodeError as e:
-                # Handle cursed LLM content that breaks the JSONL line
-                status = "corrupted"
-                errors.append(f"Line {i}: Failed to decode JSONL line (possibly cursed LLM output). Error: {e}. Content preview: '{line[:200]}...'")
-                
-            except Exception as e:
-                status = "corrupted"
-                errors.append(f"Line {i}: An unexpected error occurred: {str(e)}")
-    
     print(f"✅ Processing complete. Status: {status}")
     print(f"   - Successfully extracted {len(output_data)} text contents out of {total_lines} total lines.")
     print(f"   - Found {len(errors)} errors.")
@@ -153,8 +184,8 @@ def convert_batch_out_to_json_data(batch_file, output_file=None):
         print(f"   - Status upgraded to 'completed' (errors < 25% of successful results)")
 
     if output_file:
-        with open(output_file, 'w') as f:
-            json.dump(output_data, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(json_dumps(output_data, indent=True))
         print(f"   - Full results saved to {output_file}")
         
     return output_data, status
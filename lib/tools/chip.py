@@ -5,6 +5,7 @@ from lib.tools.code import execute_code_tool, save_code_tool_results
 from lib.tools.llm import generate_llm_tool_batch_file, get_available_llm_tools, get_tool_template
 from lib.tools.seed import generate_seed_batch_file
 from lib.tools.batch import convert_batch_in_to_json_data
+from lib.directory_manager import json_dumps
 
 available_chips = {
     "Seed Data Generation": {
@@ -122,5 +123,5 @@ def save_chip_results(chip_name, results, filenames):
         dataset = {}
         for i, item in data.items():
             dataset[i] = item
-        with open(filenames[key], 'w') as f:
-            json.dump(dataset, f)
+        with open(filenames[key], 'wb') as f:
+            f.write(json_dumps(dataset))
@@ -1,6 +1,8 @@
 import json
+from functools import lru_cache
 from datasets import Dataset
 from typing import Any, Callable
+from lib.directory_manager import json_dumps
 
 available_tools_global = {
     "merge": {
@@ -199,6 +201,8 @@ REGISTRY: dict[str, Callable[..., Any]] = {
     "combine": combine
 }
 
+# Specs are fixed for the process lifetime; the cached dict is shared, so callers must not mutate it
+@lru_cache(maxsize=64)
 def prepare_tool_use(tool_name):
     available_tools = get_available_code_tools()
     if tool_name not in available_tools:
@@ -227,7 +231,7 @@ def save_code_tool_results(tool_name, results, filename):
     else:
         # Save the results of the code tool to a file
         dataset = {}
-        with open(filename, "w") as f:
-            for i, item in enumerate(results):
-                dataset[i] = item
-            json.dump(dataset, f)
+        for i, item in enumerate(results):
+            dataset[i] = item
+        with open(filename, "wb") as f:
+            f.write(json_dumps(dataset))
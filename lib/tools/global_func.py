@@ -1,4 +1,5 @@
 import json
+from lib.directory_manager import read_json
 
 def get_type(item):
     if isinstance(item, list):
@@ -24,8 +25,7 @@ def check_data_type(data):
         "architecture": "unknown",
     }
     try: 
-        with open(data, 'r') as file:
-            data_json = json.load(file)
+        data_json = read_json(data)
         state["architecture"] = "data"
         for key, value in data_json.items():
             if get_type(value) not in list({list(d.keys())[0] for d in valid_data_types}):
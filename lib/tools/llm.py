@@ -1,5 +1,8 @@
 import json
+import logging
+from functools import lru_cache
 from .llm_templates.code import clean_dict
+from lib.directory_manager import read_json
 
 available_tools = {
     "derive_conversation":"lib/tools/llm_templates/derive_conversation.json",
@@ -8,6 +11,8 @@ available_tools = {
     "derive_instructions":"lib/tools/llm_templates/derive_instructions.json", 
     "parse_instructions":"lib/tools/llm_templates/parse_instructions.json"}
 
+logger = logging.getLogger(__name__)
+
 def is_json(myjson):
   try:
     json.loads(myjson)
@@ -23,14 +28,15 @@ def get_tool_template(tool_name):
         raise ValueError(f"Tool '{tool_name}' is not available.")
 
     if isinstance(available_tools[tool_name], str):
-        with open(available_tools[tool_name], 'r') as file:
-            template = json.load(file)
+        template = read_json(available_tools[tool_name])
     else:
         template = available_tools[tool_name]
 
     return template
 
 # First return what markers the tool needs
+# Specs are fixed for the process lifetime; the cached dict is shared, so callers must not mutate it
+@lru_cache(maxsize=64)
 def prepare_data(tool_name):
     if tool_name not in get_available_llm_tools():
         raise ValueError(f"Tool '{tool_name}' is not available.")
@@ -44,7 +50,7 @@ def prepare_data(tool_name):
 import json
 
 def generate_llm_tool_batch_file(tool_name, data, file_to_save):
-    print(f"🔍 DEBUG - Batch generation for {tool_name}:")
+    logger.debug("🔍 Batch generation for %s", tool_name)
     
     original_template = get_tool_template(tool_name)
     separated_data = {}
@@ -68,12 +74,12 @@ def generate_llm_tool_batch_file(tool_name, data, file_to_save):
             
             # Process each placeholder with context-aware replacement
             for placeholder, value in mapped_data.items():
-                print(f"🔍 DEBUG - Processing {placeholder}: {type(value)}")
+                logger.debug("🔍 Processing %s: %s", placeholder, type(value).__name__)
                 
                 # Pattern 1: "content": "__placeholder__" - needs JSON string encoding
                 content_pattern = f'"content": "{placeholder}"'
                 if content_pattern in current_str:
-                    print(f"   → Content field replacement for {placeholder}")
+                    logger.debug("   → Content field replacement for %s", placeholder)
                     if isinstance(value, (list, dict)):
                         # Convert to JSON string for content field
                         json_str = json.dumps(value)
@@ -84,19 +90,19 @@ def generate_llm_tool_batch_file(tool_name, data, file_to_save):
                     
                 # Pattern 2: "enum": __placeholder__ - needs JSON array
                 elif f'"enum": {placeholder}' in current_str:
-                    print(f"   → Enum field replacement for {placeholder}")
+                    logger.debug("   → Enum field replacement for %s", placeholder)
                     json_value = json.dumps(value)
                     current_str = current_str.replace(f'"enum": {placeholder}', f'"enum": {json_value}')
                     
                 # Pattern 3: "__placeholder__" (quoted) - JSON value replacement
                 elif f'"{placeholder}"' in current_str:
-                    print(f"   → JSON value replacement for {placeholder}")
+                    logger.debug("   → JSON value replacement for %s", placeholder)
                     json_value = json.dumps(value)
                     current_str = current_str.replace(f'"{placeholder}"', json_value)
                     
                 # Pattern 4: Regular string replacement in text content
                 elif placeholder in current_str:
-                    print(f"   → String replacement for {placeholder}")
+                    logger.debug("   → String replacement for %s", placeholder)
                     if isinstance(value, (list, dict)):
                         str_value = json.dumps(value)
                     else:
@@ -108,7 +114,7 @@ def generate_llm_tool_batch_file(tool_name, data, file_to_save):
             
             try:
                 final_request = json.loads(current_str)
-                print(f"✅ Successfully generated request for index {i}")
+                logger.debug("✅ Successfully generated request for index %s", i)
                 
             except json.JSONDecodeError as e:
                 print(f"❌ JSON Error for index {i}: {e}")
@@ -133,7 +139,7 @@ def generate_llm_tool_batch_file(tool_name, data, file_to_save):
                 dumped_value = json.dumps(value)
                 if isinstance(value, str) and dumped_value.startswith('"') and dumped_value.endswith('"'):
                     dumped_value = dumped_value[1:-1]  # Remove surrounding quotes
-                    print(f"⚠️  WARNING: Removed surrounding quotes from {placeholder}")
+                    logger.debug("⚠️  Removed surrounding quotes from %s", placeholder)
 
                 final_request = final_request.replace(placeholder, dumped_value.replace("\n", "\\n"))
             final_request = json.loads(final_request)
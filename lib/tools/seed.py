@@ -2,6 +2,7 @@ import json
 from itertools import product
 from typing import Any, Dict, List, Tuple, Iterable, Union
 import re
+from lib.directory_manager import read_json
 
 def extract_nested_paths(value: Any, current_path: List[str] = None) -> List[Tuple[List[str], Any]]:
     """
@@ -212,8 +213,7 @@ def generate_seed_batch_file(json_file: str, file_to_save: str = None) -> List[D
     if isinstance(json_file, dict):
         data = json_file
     else:
-        with open(json_file, "r") as f:
-            data = json.load(f)
+        data = read_json(json_file)
 
     constants = data.get("constants", {})
     variables = data.get("variables", {})
@@ -11,7 +11,7 @@ from lib.app_objects import step as StepClass, create_complete_flow_from_state
 from lib.state_managment import (
     create_state, start_seed_step, complete_running_step, get_uploaded_steps,
     use_llm_tool, use_code_tool, get_markers, get_uploaded_markers,
-    use_chip, get_deletable_steps, delete_step, cancel_step_batch
+    use_chip, get_deletable_steps, delete_step, cancel_step_batch, update_workflow_state
 
 )
 from lib.tools.llm import get_available_llm_tools, prepare_data
@@ -19,7 +19,7 @@ from lib.tools.code import get_available_code_tools, prepare_tool_use
 from lib.tools.chip import get_available_chips, prepare_chip_use
 from lib.tools.global_func import get_type, check_data_type, has_connection
 from lib.progress_tracker import ProgressTracker, BatchProgressTracker
-from lib.directory_manager import dir_manager
+from lib.directory_manager import dir_manager, read_json
 
 # Page config
 st.set_page_config(page_title="Workflow Editor", layout="wide")
@@ -1285,8 +1285,8 @@ def get_available_seed_files():
 def preview_seed_file(file_path):
     """Preview seed file content"""
     try:
-        with open(file_path, 'r') as f:
-            seed_data = json.load(f)
+        # Seed files are written as UTF-8; read_json decodes them the same on every platform
+        seed_data = read_json(file_path)
         # Extract actual seed if it's a progress file
         if 'seed_file' in seed_data:
             actual_seed = seed_data['seed_file']
@@ -1340,8 +1340,8 @@ def load_marker_preview_data(node_id, current_state_data):
                 resolved_path = dir_manager.resolve_path(marker_file_path)
                 
                 if resolved_path and resolved_path.exists():
-                    with open(resolved_path, 'r') as f:
-                        data = json.load(f)
+                    # Data files are written as UTF-8, so don't decode them with the platform encoding
+                    data = read_json(resolved_path)
                     
                     # Return one sample entry based on data structure
                     if isinstance(data, dict) and data:
@@ -1477,8 +1477,7 @@ def load_marker_preview_data(file_path, sample_size=5):
             }
         
         # Load the data
-        with open(final_path, 'r') as f:
-            data = json.load(f)
+        data = read_json(final_path)
         
         if isinstance(data, dict):
             sample_items = list(data.items())[:sample_size]
@@ -1679,8 +1678,7 @@ def sample_input_data_for_test(connections, current_state_data, max_entries=5):
                     full_file_path = dir_manager.get_workflow_path(workflow_name) / marker_node['file_name']
                     
                     if full_file_path.exists():
-                        with open(full_file_path, 'r') as f:
-                            full_data = json.load(f)
+                        full_data = read_json(full_file_path)
                         
                         if isinstance(full_data, dict):
                             # Sample random keys from dictionary
@@ -1838,9 +1836,7 @@ def load_workflow_state(workflow_name):
 
 def save_single_data_connections_to_state(state_file_path, connections):
     """Save single data connections to the workflow state file"""
-    try:
-        state_data = dir_manager.load_json(state_file_path)
-        
+    def add_connections(state_data):
         # Add single data connections to each step's input data
         for step in state_data.get('state_steps', []):
             step_name = StepClass.get('name', '')
@@ -1861,9 +1857,10 @@ def save_single_data_connections_to_state(state_file_path, connections):
                             node.get('name') == source_value):
                             step['data']['in'][param_name] = source_value
                             print(f"DEBUG: Saved single data connection: {step_name}.{param_name} = {source_value}")
-        
-        # Save updated state
-        dir_manager.save_json(state_file_path, state_data)
+    
+    try:
+        # Load, update and save under the state lock
+        update_workflow_state(state_file_path, add_connections)
         print("✅ Saved single data connections to state file")
         
     except Exception as e:
@@ -2368,14 +2365,6 @@ def create_single_data_block(data_name, data_type, data_value):
             set_message('error', f"❌ State file not found for workflow: {st.session_state.current_workflow}")
             return False
         
-        current_state_data = dir_manager.load_json(state_file_path)
-        
-        # Check for duplicate names
-        existing_names = [node['name'] for node in current_state_data.get('nodes', [])]
-        if data_name in existing_names:
-            set_message('error', f"❌ A node with name '{data_name}' already exists. Please use a different name.")
-            return False
-        
         # Create truncated display name (7 characters)
         display_name = str(data_value)[:7] + "..." if len(str(data_value)) > 7 else str(data_value)
         
@@ -2394,13 +2383,21 @@ def create_single_data_block(data_name, data_type, data_value):
             "is_single_data": True   # Clear flag for identification
         }
         
-        # Add to workflow state
-        if "nodes" not in current_state_data:
-            current_state_data["nodes"] = []
-        current_state_data["nodes"].append(single_data_marker)
+        def add_marker(current_state_data):
+            # Check for duplicate names against the state as it is under the lock
+            existing_names = [node['name'] for node in current_state_data.get('nodes', [])]
+            if data_name in existing_names:
+                return False
+            
+            # Add to workflow state
+            if "nodes" not in current_state_data:
+                current_state_data["nodes"] = []
+            current_state_data["nodes"].append(single_data_marker)
         
-        # Force atomic save to prevent corruption
-        dir_manager.atomic_save_json(state_file_path, current_state_data)
+        # Load, update and atomically save under the state lock
+        if not update_workflow_state(state_file_path, add_marker):
+            set_message('error', f"❌ A node with name '{data_name}' already exists. Please use a different name.")
+            return False
         
         # Force immediate flow state reconstruction
         load_workflow_state(st.session_state.current_workflow)